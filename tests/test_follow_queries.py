@@ -0,0 +1,51 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from posts.models import Follow, Post
+
+
+def create_followed_authors(user, count):
+    for i in range(count):
+        author = get_user_model().objects.create_user(
+            username=f'FeedAuthor_{user.username}_{i}'
+        )
+        Follow.objects.create(user=user, author=author)
+        Post.objects.create(text=f'Пост {author.username}', author=author)
+
+
+def count_feed_queries(client):
+    cache.clear()
+    with CaptureQueriesContext(connection) as context:
+        response = client.get('/follow/')
+    assert response.status_code == 200, 'Страница `/follow/` недоступна'
+    assert len(response.context['page_obj']) == 10, (
+        'Проверьте, что на странице `/follow/` выводится 10 постов'
+    )
+    return len(context)
+
+
+class TestFollowQueries:
+
+    @pytest.mark.django_db(transaction=True)
+    @pytest.mark.parametrize('pull_threshold', [None, 0])
+    def test_follow_index_constant_queries(
+        self, settings, client, django_user_model, pull_threshold
+    ):
+        settings.FEED_PULL_THRESHOLD = pull_threshold
+        few_user = django_user_model.objects.create_user(username='Few')
+        many_user = django_user_model.objects.create_user(username='Many')
+        create_followed_authors(few_user, 12)
+        create_followed_authors(many_user, 60)
+
+        client.force_login(few_user)
+        few_queries = count_feed_queries(client)
+        client.force_login(many_user)
+        many_queries = count_feed_queries(client)
+
+        assert few_queries == many_queries, (
+            'Проверьте, что число запросов на странице `/follow/` '
+            'не зависит от числа авторов в подписках'
+        )
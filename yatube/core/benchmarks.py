@@ -0,0 +1,10 @@
+"""Общие помощники команд замера производительности."""
+import math
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, percent):
+    """Процентиль по ближайшему рангу."""
+    values = sorted(values)
+    return values[max(math.ceil(percent / 100 * len(values)) - 1, 0)]
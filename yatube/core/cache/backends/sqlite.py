@@ -0,0 +1,281 @@
+"""Общий для всех процессов кеш в файле SQLite в режиме WAL.
+
+Пример настройки::
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache.backends.sqlite.SQLiteCache',
+            'LOCATION': '/var/tmp/yatube-cache.sqlite3',
+            'OPTIONS': {
+                'MAX_ENTRIES': 10000,
+                'MAX_SIZE': 64 * 1024 * 1024,
+            },
+        }
+    }
+
+Все воркеры gunicorn читают один файл, поэтому страница, собранная
+одним воркером, достаётся остальным. При превышении MAX_ENTRIES или
+MAX_SIZE (байт) сначала удаляются просроченные записи, затем давно
+не читавшиеся (LRU). Время последнего чтения обновляется не чаще
+раза в LRU_RESOLUTION секунд, чтобы чтения не превращались в записи.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache_entries ('
+    ' key TEXT PRIMARY KEY,'
+    ' value BLOB NOT NULL,'
+    ' expires REAL,'
+    ' accessed REAL NOT NULL,'
+    ' size INTEGER NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS cache_entries_accessed'
+    ' ON cache_entries (accessed)',
+    'CREATE INDEX IF NOT EXISTS cache_entries_expires'
+    ' ON cache_entries (expires)',
+    'CREATE TABLE IF NOT EXISTS cache_totals ('
+    ' id INTEGER PRIMARY KEY CHECK (id = 0),'
+    ' entries INTEGER NOT NULL,'
+    ' bytes INTEGER NOT NULL)',
+    'INSERT OR IGNORE INTO cache_totals VALUES (0, 0, 0)',
+    'CREATE TRIGGER IF NOT EXISTS cache_entries_insert'
+    ' AFTER INSERT ON cache_entries BEGIN'
+    ' UPDATE cache_totals SET entries = entries + 1,'
+    ' bytes = bytes + NEW.size; END',
+    'CREATE TRIGGER IF NOT EXISTS cache_entries_delete'
+    ' AFTER DELETE ON cache_entries BEGIN'
+    ' UPDATE cache_totals SET entries = entries - 1,'
+    ' bytes = bytes - OLD.size; END',
+    'CREATE TRIGGER IF NOT EXISTS cache_entries_update'
+    ' AFTER UPDATE OF size ON cache_entries BEGIN'
+    ' UPDATE cache_totals SET bytes = bytes - OLD.size + NEW.size; END',
+)
+MAX_VARIABLES = 500
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._max_size = int(options.get('MAX_SIZE', 64 * 1024 * 1024))
+        self._lru_resolution = float(options.get('LRU_RESOLUTION', 1))
+        self._busy_timeout = float(options.get('BUSY_TIMEOUT', 5))
+        self._local = threading.local()
+
+    def _connection(self):
+        # После fork соединение родителя использовать нельзя.
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self._path, timeout=self._busy_timeout, isolation_level=None
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('BEGIN IMMEDIATE')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            connection.execute('COMMIT')
+            self._local.connection = connection
+            self._local.pid = pid
+        return self._local.connection
+
+    @contextmanager
+    def _transaction(self):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        with self._transaction() as connection:
+            if self._alive(connection, key, time.time()):
+                return False
+            self._write(connection, key, value, timeout)
+        return True
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        row = self._connection().execute(
+            'SELECT value, expires, accessed FROM cache_entries'
+            ' WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return default
+        value, expires, accessed = row
+        if expires is not None and expires <= now:
+            self._delete_expired(key, now)
+            return default
+        if now - accessed > self._lru_resolution:
+            self._connection().execute(
+                'UPDATE cache_entries SET accessed = ? WHERE key = ?',
+                (now, key),
+            )
+        return pickle.loads(value)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        with self._transaction() as connection:
+            self._write(connection, key, value, timeout)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                'UPDATE cache_entries SET expires = ?'
+                ' WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                (self.get_backend_timeout(timeout), key, now),
+            )
+        return cursor.rowcount > 0
+
+    def delete(self, key, version=None):
+        key = self._key(key, version)
+        cursor = self._connection().execute(
+            'DELETE FROM cache_entries WHERE key = ?', (key,)
+        )
+        return cursor.rowcount > 0
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return self._alive(self._connection(), key, time.time())
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        with self._transaction() as connection:
+            row = connection.execute(
+                'SELECT value, expires FROM cache_entries WHERE key = ?',
+                (key,),
+            ).fetchone()
+            if row is None or (row[1] is not None and row[1] <= time.time()):
+                raise ValueError("Key '%s' not found" % key)
+            new_value = pickle.loads(row[0]) + delta
+            value = pickle.dumps(new_value, pickle.HIGHEST_PROTOCOL)
+            connection.execute(
+                'UPDATE cache_entries SET value = ?, size = ?'
+                ' WHERE key = ?', (value, len(value), key),
+            )
+        return new_value
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        now = time.time()
+        found = {}
+        made_keys = list(keys)
+        for start in range(0, len(made_keys), MAX_VARIABLES):
+            chunk = made_keys[start:start + MAX_VARIABLES]
+            rows = self._connection().execute(
+                'SELECT key, value, expires FROM cache_entries'
+                ' WHERE key IN (%s)' % ', '.join('?' * len(chunk)), chunk
+            )
+            for key, value, expires in rows:
+                if expires is None or expires > now:
+                    found[keys[key]] = pickle.loads(value)
+        return found
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        with self._transaction() as connection:
+            for key, value in data.items():
+                self._write(
+                    connection, self._key(key, version), value, timeout
+                )
+        return []
+
+    def delete_many(self, keys, version=None):
+        made_keys = [self._key(key, version) for key in keys]
+        with self._transaction() as connection:
+            for start in range(0, len(made_keys), MAX_VARIABLES):
+                chunk = made_keys[start:start + MAX_VARIABLES]
+                connection.execute(
+                    'DELETE FROM cache_entries WHERE key IN (%s)'
+                    % ', '.join('?' * len(chunk)), chunk
+                )
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache_entries')
+
+    def close(self, **kwargs):
+        # Соединение живёт всё время жизни потока: открытие файла и
+        # проверка схемы на каждый запрос обошлись бы дороже кеша.
+        pass
+
+    def totals(self):
+        """Число записей и их суммарный размер в байтах."""
+        return self._connection().execute(
+            'SELECT entries, bytes FROM cache_totals'
+        ).fetchone()
+
+    def _alive(self, connection, key, now):
+        row = connection.execute(
+            'SELECT expires FROM cache_entries WHERE key = ?', (key,)
+        ).fetchone()
+        return row is not None and (row[0] is None or row[0] > now)
+
+    def _delete_expired(self, key, now):
+        self._connection().execute(
+            'DELETE FROM cache_entries WHERE key = ? AND expires <= ?',
+            (key, now),
+        )
+
+    def _write(self, connection, key, value, timeout):
+        now = time.time()
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        expires = self.get_backend_timeout(timeout)
+        cursor = connection.execute(
+            'UPDATE cache_entries SET value = ?, expires = ?, accessed = ?,'
+            ' size = ? WHERE key = ?',
+            (value, expires, now, len(value), key),
+        )
+        if cursor.rowcount == 0:
+            connection.execute(
+                'INSERT INTO cache_entries (key, value, expires, accessed,'
+                ' size) VALUES (?, ?, ?, ?, ?)',
+                (key, value, expires, now, len(value)),
+            )
+        self._cull(connection, now)
+
+    def _over_limits(self, connection):
+        entries, size = connection.execute(
+            'SELECT entries, bytes FROM cache_totals'
+        ).fetchone()
+        over = entries > self._max_entries or size > self._max_size
+        return over, entries
+
+    def _cull(self, connection, now):
+        over, entries = self._over_limits(connection)
+        if not over:
+            return
+        if self._cull_frequency == 0:
+            connection.execute('DELETE FROM cache_entries')
+            return
+        connection.execute(
+            'DELETE FROM cache_entries WHERE expires <= ?', (now,)
+        )
+        over, entries = self._over_limits(connection)
+        while over and entries:
+            connection.execute(
+                'DELETE FROM cache_entries WHERE key IN ('
+                ' SELECT key FROM cache_entries ORDER BY accessed LIMIT ?)',
+                (max(1, entries // self._cull_frequency),),
+            )
+            over, entries = self._over_limits(connection)
@@ -0,0 +1,274 @@
+"""Двухуровневый кеш: маленький L1 в памяти процесса перед общим L2.
+
+Пример настройки::
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache.backends.tiered.TieredCache',
+            'LOCATION': 'shared',
+            'OPTIONS': {
+                'L1_MAX_ENTRIES': 1000,
+                'L1_TIMEOUT': 5,
+                'SYNC_INTERVAL': 1,
+                'L1_EXCLUDE_PREFIXES': ('lock:',),
+            },
+        },
+        'shared': {
+            'BACKEND': 'core.cache.backends.sqlite.SQLiteCache',
+            'LOCATION': '/var/tmp/yatube-cache.sqlite3',
+        },
+    }
+
+LOCATION — алиас кеша второго уровня. Все записи идут в L2, а ключ
+изменённой записи попадает в журнал изменений в том же L2 под
+возрастающим номером. Раз в SYNC_INTERVAL секунд каждый процесс
+дочитывает журнал и выбрасывает из своего L1 изменённые другими
+ключи, поэтому чужая запись становится видна не позже чем через
+SYNC_INTERVAL секунд; L1_TIMEOUT дополнительно ограничивает возраст
+любой записи L1. Ключи с префиксами из L1_EXCLUDE_PREFIXES (блокировки,
+счётчики) всегда читаются из L2 и в журнал не пишутся.
+
+Объект кеша Django создаёт в каждом потоке свой, поэтому L1, его
+блокировка и счётчики хранятся на уровне модуля по LOCATION, как
+в LocMemCache: все потоки процесса делят один L1.
+"""
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SEQUENCE_KEY = 'tiered:sequence'
+LOG_KEY = 'tiered:log:{number}'
+CLEAR_MARKER = '*'
+MISSING = object()
+
+# Состояние L1 по LOCATION, общее для всех потоков процесса.
+_l1s = {}
+_locks = {}
+_hits = {}
+_syncs = {}
+
+
+class TieredCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._l2_alias = location
+        self._l1_max_entries = int(options.get('L1_MAX_ENTRIES', 1000))
+        self._l1_timeout = float(options.get('L1_TIMEOUT', 5))
+        self._sync_interval = float(options.get('SYNC_INTERVAL', 1))
+        self._log_timeout = int(options.get(
+            'LOG_TIMEOUT', max(60, 10 * self._sync_interval)
+        ))
+        self._exclude = tuple(options.get('L1_EXCLUDE_PREFIXES', ()))
+        self._l1 = _l1s.setdefault(location, OrderedDict())
+        self._lock = _locks.setdefault(location, threading.Lock())
+        self._hits = _hits.setdefault(
+            location, {'l1': 0, 'l2': 0, 'miss': 0}
+        )
+        self._sync_state = _syncs.setdefault(
+            location, {'seen': None, 'next_sync': 0}
+        )
+
+    @property
+    def l2(self):
+        return caches[self._l2_alias]
+
+    def tier_stats(self):
+        """Попадания по уровням и их доля для текущего процесса."""
+        with self._lock:
+            hits = dict(self._hits)
+        total = sum(hits.values())
+        return {
+            'l1_hits': hits['l1'],
+            'l2_hits': hits['l2'],
+            'misses': hits['miss'],
+            'l1_hit_ratio': hits['l1'] / total if total else 0.0,
+            'l2_hit_ratio': hits['l2'] / total if total else 0.0,
+        }
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.l2.add(key, value, timeout, version)
+        if added:
+            self._changed(key, version, value, timeout)
+        return added
+
+    def get(self, key, default=None, version=None):
+        self._sync()
+        cached = self._l1_get(key, version)
+        if cached is not MISSING:
+            return cached
+        value = self.l2.get(key, MISSING, version)
+        if value is MISSING:
+            self._hit('miss')
+            return default
+        self._hit('l2')
+        self._l1_set(key, version, value, DEFAULT_TIMEOUT)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.l2.set(key, value, timeout, version)
+        self._changed(key, version, value, timeout)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        touched = self.l2.touch(key, timeout, version)
+        self._changed(key, version)
+        return touched
+
+    def delete(self, key, version=None):
+        deleted = self.l2.delete(key, version)
+        self._changed(key, version)
+        return deleted
+
+    def has_key(self, key, version=None):
+        self._sync()
+        if self._l1_get(key, version, count=False) is not MISSING:
+            return True
+        return self.l2.has_key(key, version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.l2.incr(key, delta, version)
+        self._changed(key, version)
+        return value
+
+    def get_many(self, keys, version=None):
+        self._sync()
+        found = {}
+        missing = []
+        for key in keys:
+            value = self._l1_get(key, version)
+            if value is MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        if missing:
+            from_l2 = self.l2.get_many(missing, version)
+            for key in missing:
+                if key in from_l2:
+                    self._hit('l2')
+                    self._l1_set(key, version, from_l2[key], DEFAULT_TIMEOUT)
+                else:
+                    self._hit('miss')
+            found.update(from_l2)
+        return found
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.l2.set_many(data, timeout, version)
+        for key, value in data.items():
+            if key not in failed:
+                self._changed(key, version, value, timeout)
+        return failed
+
+    def delete_many(self, keys, version=None):
+        self.l2.delete_many(keys, version)
+        for key in keys:
+            self._changed(key, version)
+
+    def clear(self):
+        self.l2.clear()
+        with self._lock:
+            self._l1.clear()
+            self._sync_state['seen'] = None
+        self._publish(CLEAR_MARKER)
+
+    def _hit(self, tier):
+        with self._lock:
+            self._hits[tier] += 1
+
+    def _excluded(self, key):
+        return self._exclude and key.startswith(self._exclude)
+
+    def _l1_get(self, key, version, count=True):
+        if self._excluded(key):
+            return MISSING
+        made_key = self.make_key(key, version)
+        with self._lock:
+            entry = self._l1.get(made_key)
+            if entry is None:
+                return MISSING
+            pickled, expires = entry
+            if expires <= time.time():
+                del self._l1[made_key]
+                return MISSING
+            self._l1.move_to_end(made_key)
+            if count:
+                self._hits['l1'] += 1
+        return pickle.loads(pickled)
+
+    def _l1_set(self, key, version, value, timeout):
+        if self._excluded(key):
+            return
+        expires = time.time() + self._l1_timeout
+        backend_expires = self.get_backend_timeout(timeout)
+        if backend_expires is not None:
+            expires = min(expires, backend_expires)
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        made_key = self.make_key(key, version)
+        with self._lock:
+            self._l1[made_key] = (pickled, expires)
+            self._l1.move_to_end(made_key)
+            while len(self._l1) > self._l1_max_entries:
+                self._l1.popitem(last=False)
+
+    def _changed(self, key, version, value=MISSING, timeout=DEFAULT_TIMEOUT):
+        if self._excluded(key):
+            return
+        made_key = self.make_key(key, version)
+        with self._lock:
+            self._l1.pop(made_key, None)
+        if value is not MISSING:
+            self._l1_set(key, version, value, timeout)
+        self._publish(made_key)
+
+    def _publish(self, made_key):
+        l2 = self.l2
+        try:
+            number = l2.incr(SEQUENCE_KEY)
+        except ValueError:
+            # Счётчика ещё нет или он вытеснен: остальные процессы
+            # увидят сброс номера и очистят L1 целиком.
+            l2.add(SEQUENCE_KEY, 0, None)
+            try:
+                number = l2.incr(SEQUENCE_KEY)
+            except ValueError:
+                return
+        l2.set(LOG_KEY.format(number=number), made_key, self._log_timeout)
+
+    def _sync(self):
+        state = self._sync_state
+        now = time.time()
+        with self._lock:
+            # Журнал дочитывает один поток, остальные ждут следующего
+            # интервала.
+            if now < state['next_sync']:
+                return
+            state['next_sync'] = now + self._sync_interval
+        sequence = self.l2.get(SEQUENCE_KEY)
+        with self._lock:
+            seen, state['seen'] = state['seen'], sequence
+        if sequence == seen or seen is None:
+            return
+        if (sequence is None or sequence < seen
+                or sequence - seen > self._l1_max_entries):
+            self._clear_l1()
+            return
+        log_keys = [
+            LOG_KEY.format(number=number)
+            for number in range(seen + 1, sequence + 1)
+        ]
+        changed = self.l2.get_many(log_keys)
+        if len(changed) < len(log_keys) or CLEAR_MARKER in changed.values():
+            self._clear_l1()
+            return
+        with self._lock:
+            for made_key in changed.values():
+                self._l1.pop(made_key, None)
+
+    def _clear_l1(self):
+        with self._lock:
+            self._l1.clear()
@@ -0,0 +1,264 @@
+import hashlib
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.urls import Resolver404, resolve
+from django.utils.cache import get_cache_key, learn_cache_key
+
+VERSION_KEY = 'version:{name}'
+LOCK_KEY = 'lock:{key}'
+STATS_KEY = 'page-stats:{view}:{event}'
+STATS_VIEWS_KEY = 'page-stats:views'
+EVENTS = ('hit', 'miss', 'stale', 'rebuild')
+MISS_LOCK_KEY = 'page-miss:{prefix}:{url}'
+MISS_POLL_INTERVAL = 0.05
+
+# Счётчики копятся в памяти процесса и раз в PAGE_CACHE_STATS_INTERVAL
+# секунд сбрасываются в общий кеш: попадание не должно стоить записи.
+_pending = Counter()
+_pending_lock = threading.Lock()
+_registered = set()
+_next_flush = 0
+
+
+def _cache():
+    return caches[settings.PAGE_CACHE_ALIAS]
+
+
+def get_version(name):
+    """Текущая версия содержимого name.
+
+    Начальное значение берётся из часов, чтобы версия, вытесненная
+    из кеша, не совпала ни с одной из выданных раньше.
+    """
+    cache = _cache()
+    key = VERSION_KEY.format(name=name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key, 0)
+    return version
+
+
+def get_versions(names):
+    """Версии сразу нескольких имён одним обращением к кешу."""
+    cache = _cache()
+    keys = {VERSION_KEY.format(name=name): name for name in names}
+    found = cache.get_many(keys)
+    for key in keys.keys() - found.keys():
+        cache.add(key, time.time_ns(), None)
+        found[key] = cache.get(key, 0)
+    return [found[key] for key in keys]
+
+
+def bump_version(name):
+    """Делает устаревшими все страницы, зависящие от name."""
+    cache = _cache()
+    key = VERSION_KEY.format(name=name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def _count(view, event):
+    global _next_flush
+    now = time.time()
+    with _pending_lock:
+        _pending[view, event] += 1
+        if now < _next_flush:
+            return
+        _next_flush = now + settings.PAGE_CACHE_STATS_INTERVAL
+    flush_page_cache_stats()
+
+
+def flush_page_cache_stats():
+    """Переносит накопленные в процессе счётчики в общий кеш."""
+    with _pending_lock:
+        pending = dict(_pending)
+        _pending.clear()
+    if not pending:
+        return
+    cache = _cache()
+    for (view, event), count in pending.items():
+        key = STATS_KEY.format(view=view, event=event)
+        if not cache.add(key, count, None):
+            try:
+                cache.incr(key, count)
+            except ValueError:
+                cache.add(key, count, None)
+    views = {view for view, _ in pending}
+    with _pending_lock:
+        _registered.update(views)
+        views = set(_registered)
+    # Список view правят все процессы без блокировки; потерянное
+    # при гонке имя каждый процесс допишет при следующем сбросе.
+    known = cache.get(STATS_VIEWS_KEY, frozenset())
+    if not views <= known:
+        cache.set(STATS_VIEWS_KEY, known | views, None)
+
+
+def reset_page_cache_stats():
+    """Забывает несброшенные счётчики процесса."""
+    with _pending_lock:
+        _pending.clear()
+        _registered.clear()
+
+
+def acquire_rebuild_lock(cache_key):
+    """Берёт блокировку на перестройку страницы; False, если она занята."""
+    return _cache().add(
+        LOCK_KEY.format(key=cache_key), 1, settings.PAGE_CACHE_LOCK_TIMEOUT
+    )
+
+
+def release_rebuild_lock(cache_key):
+    _cache().delete(LOCK_KEY.format(key=cache_key))
+
+
+def page_cache_stats():
+    """Счётчики hit/miss/stale/rebuild по каждому кешируемому view."""
+    flush_page_cache_stats()
+    cache = _cache()
+    views = sorted(cache.get(STATS_VIEWS_KEY, frozenset()))
+    keys = {
+        STATS_KEY.format(view=view, event=event): (view, event)
+        for view in views for event in EVENTS
+    }
+    values = cache.get_many(keys)
+    stats = {view: dict.fromkeys(EVENTS, 0) for view in views}
+    for key, (view, event) in keys.items():
+        stats[view][event] = values.get(key, 0)
+    return stats
+
+
+def is_anonymous_cacheable(request):
+    """Запрос может обслужить кеш анонимных страниц.
+
+    Только GET/HEAD без единой cookie к view из ANONYMOUS_PAGE_CACHE:
+    у такого запроса нет сессии, значит и ничего персонального.
+    """
+    if request.method not in ('GET', 'HEAD') or request.COOKIES:
+        return False
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return False
+    return match.view_name in settings.ANONYMOUS_PAGE_CACHE
+
+
+def serve_cached(request, key_prefix, names, label, build, timeout=None):
+    """Отдаёт ответ из кеша или строит его через build().
+
+    Устаревшая копия (сменилась версия одного из names или истёк
+    timeout) ещё PAGE_CACHE_STALE_TTL секунд отдаётся как есть, пока
+    один процесс, взявший блокировку в кеше, строит новую: так истечение
+    кеша под нагрузкой не превращается в шквал одинаковых запросов
+    к базе. Если копии нет совсем, страницу так же строит один процесс,
+    а остальные ждут её до PAGE_CACHE_MISS_WAIT секунд. Заголовки Vary
+    учитываются так же, как в cache_page.
+    """
+    cache = _cache()
+    fresh_timeout = settings.PAGE_CACHE_TIMEOUT if timeout is None else timeout
+    version = tuple(get_version(name) for name in names)
+    cache_key = get_cache_key(request, key_prefix, 'GET', cache)
+    entry = cache.get(cache_key) if cache_key else None
+    if entry is not None and _is_fresh(entry, version):
+        _count(label, 'hit')
+        return entry['response']
+    # Пока страницы нет в кеше, ключа по заголовкам Vary тоже может
+    # не быть: блокировка берётся по адресу.
+    lock_key = cache_key or MISS_LOCK_KEY.format(
+        prefix=key_prefix,
+        url=hashlib.md5(request.build_absolute_uri().encode()).hexdigest(),
+    )
+    if not acquire_rebuild_lock(lock_key):
+        if entry is not None:
+            _count(label, 'stale')
+            return entry['response']
+        entry = _wait_for_entry(request, key_prefix, version)
+        if entry is not None:
+            _count(label, 'hit')
+            return entry['response']
+        _count(label, 'miss')
+        return _store(request, build(), key_prefix, version, fresh_timeout)
+    try:
+        _count(label, 'miss' if entry is None else 'rebuild')
+        return _store(request, build(), key_prefix, version, fresh_timeout)
+    finally:
+        release_rebuild_lock(lock_key)
+
+
+def _is_fresh(entry, version):
+    return entry['version'] == version and entry['fresh_until'] > time.time()
+
+
+def _wait_for_entry(request, key_prefix, version):
+    """Ждёт до PAGE_CACHE_MISS_WAIT секунд, пока страницу, которой ещё
+    нет в кеше, положит процесс, взявший блокировку."""
+    cache = _cache()
+    deadline = time.monotonic() + settings.PAGE_CACHE_MISS_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(MISS_POLL_INTERVAL)
+        cache_key = get_cache_key(request, key_prefix, 'GET', cache)
+        entry = cache.get(cache_key) if cache_key else None
+        if entry is not None and _is_fresh(entry, version):
+            return entry
+    return None
+
+
+def versioned_cache_page(*names, timeout=None):
+    """Кеширует GET-ответ view, пока не сменится версия одного из names.
+
+    Ответы разных пользователей хранятся отдельно. Запросы, которые
+    уже обслуживает AnonymousPageCacheMiddleware, пропускаются, чтобы
+    не хранить одну страницу дважды. Cache-Control в ответ
+    не добавляется, чтобы браузер не держал устаревшую страницу.
+    """
+    def decorator(view):
+        view_name = view.__name__
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if (request.method not in ('GET', 'HEAD')
+                    or is_anonymous_cacheable(request)):
+                return view(request, *args, **kwargs)
+            return serve_cached(
+                request,
+                f'page:{view_name}:{request.user.pk or 0}',
+                names,
+                view_name,
+                lambda: view(request, *args, **kwargs),
+                timeout,
+            )
+        return wrapper
+    return decorator
+
+
+def _store(request, response, key_prefix, version, fresh_timeout):
+    cache = _cache()
+    if response.streaming or response.status_code != 200:
+        return response
+    if response.cookies:
+        # Ответ со Set-Cookie персональный: его нельзя отдавать другим.
+        return response
+    entry_timeout = fresh_timeout + settings.PAGE_CACHE_STALE_TTL
+    cache_key = learn_cache_key(
+        request, response, entry_timeout, key_prefix, cache
+    )
+    cache.set(
+        cache_key,
+        {
+            'response': response,
+            'version': version,
+            'fresh_until': time.time() + fresh_timeout,
+        },
+        entry_timeout,
+    )
+    return response
@@ -0,0 +1,121 @@
+"""Хранилище ключей sorl-thumbnail: кеш с записью в файл-индекс.
+
+Пример настройки::
+
+    THUMBNAIL_KVSTORE = 'core.cache.thumbnail_kvstore.KVStore'
+    THUMBNAIL_CACHE = 'default'
+    THUMBNAIL_INDEX_FILE = '/var/tmp/yatube-thumbnails.sqlite3'
+
+Чтение идёт из кеша THUMBNAIL_CACHE, при промахе — из индекса,
+небольшого файла SQLite с одной таблицей ключ-значение, и найденное
+кладётся обратно в кеш. Запись попадает сразу в индекс и в кеш.
+Основная база при этом не используется вовсе, а индекс переживает
+очистку кеша и общий для всех процессов.
+"""
+import os
+import sqlite3
+import threading
+
+from django.conf import settings as django_settings
+from django.core.cache import caches
+from sorl.thumbnail.conf import settings
+from sorl.thumbnail.kvstores.base import KVStoreBase
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS thumbnail_index ('
+    ' key TEXT PRIMARY KEY,'
+    ' value TEXT NOT NULL) WITHOUT ROWID'
+)
+MISSING = ''
+CHUNK_SIZE = 500
+
+
+class KVStore(KVStoreBase):
+    def __init__(self):
+        super().__init__()
+        self._path = django_settings.THUMBNAIL_INDEX_FILE
+        self._local = threading.local()
+
+    @property
+    def cache(self):
+        return caches[settings.THUMBNAIL_CACHE]
+
+    def _connection(self):
+        # После fork соединение родителя использовать нельзя.
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self._path, timeout=5, isolation_level=None
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(SCHEMA)
+            self._local.connection = connection
+            self._local.pid = pid
+        return self._local.connection
+
+    def _get_raw(self, key):
+        value = self.cache.get(key)
+        if value is None:
+            row = self._connection().execute(
+                'SELECT value FROM thumbnail_index WHERE key = ?', (key,)
+            ).fetchone()
+            # Отсутствие тоже кешируется, чтобы не ходить в индекс
+            # повторно; запись ключа его перезапишет.
+            value = MISSING if row is None else row[0]
+            self.cache.set(key, value, settings.THUMBNAIL_CACHE_TIMEOUT)
+        return value or None
+
+    def _set_raw(self, key, value):
+        self._connection().execute(
+            'INSERT OR REPLACE INTO thumbnail_index (key, value)'
+            ' VALUES (?, ?)', (key, value),
+        )
+        self.cache.set(key, value, settings.THUMBNAIL_CACHE_TIMEOUT)
+
+    def _delete_raw(self, *keys):
+        connection = self._connection()
+        for start in range(0, len(keys), CHUNK_SIZE):
+            chunk = keys[start:start + CHUNK_SIZE]
+            connection.execute(
+                'DELETE FROM thumbnail_index WHERE key IN (%s)'
+                % ', '.join('?' * len(chunk)), chunk
+            )
+        self.cache.delete_many(keys)
+
+    def _find_keys_raw(self, prefix):
+        rows = self._connection().execute(
+            'SELECT key FROM thumbnail_index WHERE key >= ? AND key < ?',
+            (prefix, prefix + '\uffff'),
+        )
+        return [key for key, in rows]
+
+    def import_rows(self, rows):
+        """Записывает пары (ключ, значение) в индекс одной транзакцией."""
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany(
+                'INSERT OR REPLACE INTO thumbnail_index (key, value)'
+                ' VALUES (?, ?)', rows,
+            )
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def warm(self):
+        """Загружает весь индекс в кеш; возвращает число ключей."""
+        rows = self._connection().execute(
+            'SELECT key, value FROM thumbnail_index'
+        )
+        count = 0
+        while True:
+            chunk = dict(rows.fetchmany(CHUNK_SIZE))
+            if not chunk:
+                return count
+            self.cache.set_many(chunk, settings.THUMBNAIL_CACHE_TIMEOUT)
+            count += len(chunk)
@@ -0,0 +1,84 @@
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+BACKENDS = {
+    'locmem': (
+        'django.core.cache.backends.locmem.LocMemCache', 'benchmark'
+    ),
+    'sqlite': ('core.cache.backends.sqlite.SQLiteCache', None),
+}
+
+
+def run_worker(backend, location, params, keys, operations, value_size,
+               seed):
+    """Имитирует воркер: читает ключ, при промахе строит и кладёт его."""
+    cache = import_string(backend)(location, params)
+    rng = random.Random(seed)
+    value = os.urandom(value_size)
+    hits = 0
+    started = time.perf_counter()
+    for _ in range(operations):
+        # Популярность ключей убывает по степенному закону,
+        # как у страниц ленты.
+        key = f'page:{int(keys ** rng.random()) - 1}'
+        if cache.get(key) is not None:
+            hits += 1
+        else:
+            cache.set(key, value, 300)
+    return hits, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает LocMemCache и общий SQLite-кеш: доля попаданий '
+        'и скорость при нескольких процессах-воркерах.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--operations', type=int, default=5000)
+        parser.add_argument('--keys', type=int, default=2000)
+        parser.add_argument('--value-size', type=int, default=20000)
+        parser.add_argument('--max-entries', type=int, default=1000)
+        parser.add_argument(
+            '--backend', choices=sorted(BACKENDS), action='append',
+            help='Какие кеши сравнивать (по умолчанию все).',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            'backend\thit ratio\tops/sec\tworkers\toperations'
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            for name in options['backend'] or sorted(BACKENDS):
+                backend, location = BACKENDS[name]
+                if location is None:
+                    location = os.path.join(directory, f'{name}.sqlite3')
+                self.report(name, backend, location, options)
+
+    def report(self, name, backend, location, options):
+        params = {'OPTIONS': {'MAX_ENTRIES': options['max_entries']}}
+        workers = options['workers']
+        operations = options['operations']
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(
+                run_worker,
+                *zip(*[
+                    (backend, location, params, options['keys'],
+                     operations, options['value_size'], seed)
+                    for seed in range(workers)
+                ]),
+            ))
+        hits = sum(hit for hit, _ in results)
+        elapsed = max(seconds for _, seconds in results)
+        total = workers * operations
+        self.stdout.write(
+            f'{name}\t{hits / total:.3f}\t{total / elapsed:.0f}'
+            f'\t{workers}\t{total}'
+        )
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from core.cache.pages import EVENTS, page_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Показывает счётчики hit/miss/stale/rebuild кеша страниц.'
+
+    def handle(self, *args, **options):
+        stats = page_cache_stats()
+        if not stats:
+            self.stdout.write('Кеш страниц ещё не использовался.')
+            return
+        self.stdout.write('\t'.join(('view',) + EVENTS))
+        for view, counters in stats.items():
+            self.stdout.write('\t'.join(
+                [view] + [str(counters[event]) for event in EVENTS]
+            ))
@@ -0,0 +1,70 @@
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.urls import resolve
+
+from core.cache.pages import is_anonymous_cacheable, serve_cached
+from core.query_budget import QueryRecorder, check_budget, record
+
+
+class AnonymousPageCacheMiddleware:
+    """Кеш целых страниц для анонимных запросов без cookie.
+
+    Стоит до SessionMiddleware: попадание в кеш отдаётся, не трогая
+    ни сессию, ни базу. Запросы с любой cookie (сессия, csrftoken)
+    и ответы, которые ставят cookie, через кеш не проходят, поэтому
+    персональная шапка страницы не может попасть к другому посетителю.
+    Какие view кешируются и от каких версий содержимого они зависят,
+    задаёт settings.ANONYMOUS_PAGE_CACHE.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not is_anonymous_cacheable(request):
+            return self.get_response(request)
+        view_name = resolve(request.path_info).view_name
+        return serve_cached(
+            request,
+            f'anonymous:{view_name}',
+            settings.ANONYMOUS_PAGE_CACHE[view_name],
+            f'anonymous:{view_name}',
+            lambda: self.get_response(request),
+        )
+
+
+class QueryBudgetMiddleware:
+    """Считает SQL-запросы каждого запроса и сверяет их с бюджетом view.
+
+    Стоит в начале MIDDLEWARE, чтобы учитывать и запросы сессии
+    и пользователя. Бюджет задаёт декоратор core.query_budget.query_budget;
+    при QUERY_BUDGET_SERVER_TIMING число запросов и время SQL
+    отдаются в заголовке Server-Timing.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return response
+        budget = getattr(match.func, 'query_budget', None)
+        record(
+            match.view_name,
+            recorder,
+            check_budget(match.view_name, budget, recorder),
+        )
+        if settings.QUERY_BUDGET_SERVER_TIMING:
+            response['Server-Timing'] = (
+                f'sql;dur={recorder.sql_time * 1000:.1f};'
+                f'desc="{recorder.count} queries"'
+            )
+        return response
@@ -0,0 +1,141 @@
+"""Бюджет SQL-запросов для view.
+
+View объявляет бюджет декоратором::
+
+    @query_budget(8)
+    def index(request):
+        ...
+
+QueryBudgetMiddleware считает запросы и время SQL каждого запроса к
+сайту. Если view вышел из бюджета, при QUERY_BUDGET_STRICT (в тестах)
+поднимается QueryBudgetExceeded, а на боевом сервере в лог пишется
+предупреждение с отпечатками самых частых запросов: N+1 видно по
+одному отпечатку, повторённому много раз.
+"""
+import logging
+import re
+import threading
+import time
+from collections import Counter, namedtuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+Budget = namedtuple('Budget', 'queries sql_time')
+
+FINGERPRINT_RULES = (
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'(?<![\w"])-?\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'%s'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)'), '(...)'),
+    (re.compile(r'\s+'), ' '),
+)
+TOP_FINGERPRINTS = 5
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_budget(queries, sql_time=None):
+    """Не больше queries запросов и sql_time секунд SQL на один вызов."""
+    def decorator(view):
+        # wraps в других декораторах копирует атрибут во внешнюю обёртку.
+        view.query_budget = Budget(queries, sql_time)
+        return view
+    return decorator
+
+
+def fingerprint(sql):
+    """SQL без значений: одинаковые по форме запросы совпадают."""
+    for pattern, replacement in FINGERPRINT_RULES:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+class QueryRecorder:
+    """execute_wrapper, запоминающий SQL и длительность запросов."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - start))
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def sql_time(self):
+        return sum(duration for _, duration in self.queries)
+
+    def fingerprints(self):
+        """Самые частые отпечатки: (отпечаток, сколько раз, время)."""
+        counts = Counter()
+        times = Counter()
+        for sql, duration in self.queries:
+            key = fingerprint(sql)
+            counts[key] += 1
+            times[key] += duration
+        return [
+            (key, count, times[key])
+            for key, count in counts.most_common(TOP_FINGERPRINTS)
+        ]
+
+
+def record(view_name, recorder, over_budget):
+    with _stats_lock:
+        stats = _stats.setdefault(view_name, {
+            'requests': 0, 'queries': 0, 'sql_time': 0.0, 'over_budget': 0,
+        })
+        stats['requests'] += 1
+        stats['queries'] += recorder.count
+        stats['sql_time'] += recorder.sql_time
+        stats['over_budget'] += over_budget
+
+
+def view_query_stats():
+    """Запросы и время SQL по view с запуска процесса."""
+    with _stats_lock:
+        return {view: dict(stats) for view, stats in _stats.items()}
+
+
+def reset_view_query_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def check_budget(view_name, budget, recorder):
+    """Сверяет запрос с бюджетом view; True, если бюджет превышен."""
+    if budget is None:
+        return False
+    over = recorder.count > budget.queries or (
+        budget.sql_time is not None and recorder.sql_time > budget.sql_time
+    )
+    if not over:
+        return False
+    message = (
+        f'{view_name}: {recorder.count} запросов за '
+        f'{recorder.sql_time * 1000:.1f} мс, бюджет {budget.queries}'
+        + (
+            f' за {budget.sql_time * 1000:.0f} мс'
+            if budget.sql_time is not None else ''
+        )
+    )
+    details = '\n'.join(
+        f'  {count}× {duration * 1000:.1f} мс {key}'
+        for key, count, duration in recorder.fingerprints()
+    )
+    if settings.QUERY_BUDGET_STRICT:
+        raise QueryBudgetExceeded(f'{message}\n{details}')
+    logger.warning('%s\n%s', message, details)
+    return True
@@ -0,0 +1,63 @@
+"""Хранилище файлов, адресуемых по содержимому.
+
+Имя файла — sha256 его содержимого, файлы раскладываются по двум
+уровням вложенных каталогов по первым символам хеша::
+
+    posts/3f/a2/3fa2…9c.jpg
+
+Каталог, заданный upload_to, и расширение сохраняются. Повторная
+загрузка того же файла ничего не пишет и возвращает уже сохранённое
+имя, поэтому один файл может принадлежать нескольким записям:
+удалять его можно, только когда на него никто не ссылается.
+"""
+import hashlib
+import os
+import re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+HASHED_NAME = re.compile(
+    r'(^|/)(?P<a>[0-9a-f]{2})/(?P<b>[0-9a-f]{2})/(?P=a)(?P=b)[0-9a-f]{60}'
+    r'(\.[^/]*)?$'
+)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
+
+    def hashed_name(self, name, content):
+        """Имя в хранилище для содержимого content, загруженного как name."""
+        digest = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        digest = digest.hexdigest()
+        match = HASHED_NAME.search(name)
+        if match:
+            # Имя уже из этого хранилища: каталоги шардов не вкладываются.
+            directory = name[:match.start()]
+        else:
+            directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(
+            directory, digest[:2], digest[2:4], digest + extension
+        ).replace('\\', '/')
+
+    @staticmethod
+    def is_hashed(name):
+        return HASHED_NAME.search(name) is not None
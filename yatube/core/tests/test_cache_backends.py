@@ -0,0 +1,158 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+
+from core.cache.backends.sqlite import SQLiteCache
+from core.cache.backends import tiered
+from core.cache.backends.tiered import TieredCache
+
+
+class SQLiteCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.location = os.path.join(self.directory, 'cache.sqlite3')
+        self.cache = self.make_cache()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def make_cache(self, **options):
+        return SQLiteCache(self.location, {'OPTIONS': options})
+
+    def test_basic_operations(self):
+        """Основные операции ведут себя как у встроенных кешей."""
+        self.assertIsNone(self.cache.get('key'))
+        self.cache.set('key', {'value': 1})
+        self.assertEqual(self.cache.get('key'), {'value': 1})
+        self.assertFalse(self.cache.add('key', 2))
+        self.assertTrue(self.cache.add('other', 2))
+        self.assertEqual(self.cache.incr('other', 3), 5)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+        self.assertEqual(
+            self.cache.get_many(['key', 'other', 'missing']),
+            {'key': {'value': 1}, 'other': 5},
+        )
+        self.cache.delete('key')
+        self.assertFalse(self.cache.has_key('key'))
+        self.cache.clear()
+        self.assertEqual(self.cache.totals(), (0, 0))
+
+    def test_expired_entries_are_not_returned(self):
+        """Просроченная запись не отдаётся и не мешает add."""
+        self.cache.set('key', 'value', 0.01)
+        time.sleep(0.02)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertTrue(self.cache.add('key', 'new'))
+
+    def test_shared_between_instances(self):
+        """Запись одного экземпляра видна другому, как другому процессу."""
+        self.cache.set('page', 'content')
+        self.assertEqual(self.make_cache().get('page'), 'content')
+
+    def test_lru_eviction_by_entries(self):
+        """При переполнении вытесняются давно не читавшиеся записи."""
+        cache = self.make_cache(
+            MAX_ENTRIES=4, CULL_FREQUENCY=4, LRU_RESOLUTION=0
+        )
+        for i in range(4):
+            cache.set(f'key{i}', i)
+        cache.get('key0')
+        cache.set('key4', 4)
+        self.assertEqual(cache.get('key0'), 0)
+        self.assertIsNone(cache.get('key1'))
+        self.assertEqual(cache.totals()[0], 4)
+
+    def test_eviction_by_size(self):
+        """Суммарный размер записей не превышает MAX_SIZE."""
+        cache = self.make_cache(MAX_SIZE=10000)
+        for i in range(10):
+            cache.set(f'key{i}', b'x' * 2000)
+        self.assertLessEqual(cache.totals()[1], 10000)
+        self.assertIsNotNone(cache.get('key9'))
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'l2': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tiered-l2',
+    },
+})
+class TieredCacheTest(SimpleTestCase):
+    def setUp(self):
+        caches['l2'].clear()
+        self.new_process()
+
+    def new_process(self):
+        """Следующие кеши получат свой L1, как в другом процессе."""
+        for storage in (tiered._l1s, tiered._locks, tiered._hits,
+                        tiered._syncs):
+            storage.clear()
+
+    def make_cache(self, **options):
+        return TieredCache('l2', {'OPTIONS': options})
+
+    def test_reads_are_served_from_l1(self):
+        """Повторное чтение не обращается к L2."""
+        cache = self.make_cache()
+        cache.set('key', 'value')
+        caches['l2'].set('key', 'changed behind the back')
+        self.assertEqual(cache.get('key'), 'value')
+        self.assertIsNone(cache.get('missing'))
+        self.assertEqual(cache.tier_stats()['l1_hits'], 1)
+        self.assertEqual(cache.tier_stats()['misses'], 1)
+
+    def test_other_process_writes_seen_after_sync(self):
+        """Запись одного процесса видна другому после синхронизации."""
+        first = self.make_cache(SYNC_INTERVAL=0)
+        self.new_process()
+        second = self.make_cache(SYNC_INTERVAL=0)
+        first.set('version', 1)
+        self.assertEqual(second.get('version'), 1)
+        first.incr('version')
+        self.assertEqual(second.get('version'), 2)
+        first.delete('version')
+        self.assertIsNone(second.get('version'))
+        stats = second.tier_stats()
+        self.assertEqual(stats['l2_hits'], 2)
+
+    def test_lost_log_clears_l1(self):
+        """Если журнал изменений потерян, L1 очищается целиком."""
+        first = self.make_cache(SYNC_INTERVAL=0)
+        self.new_process()
+        second = self.make_cache(SYNC_INTERVAL=0)
+        first.set('key', 'old')
+        second.get('key')
+        caches['l2'].set('key', 'new')
+        first.set('other', 1)
+        caches['l2'].delete_many(
+            [f'tiered:log:{number}' for number in range(10)]
+        )
+        self.assertEqual(second.get('key'), 'new')
+
+    def test_threads_share_l1(self):
+        """Потоки процесса делят один L1 и общие счётчики."""
+        self.make_cache().set('key', 'value')
+        values = []
+        thread = threading.Thread(
+            target=lambda: values.append(self.make_cache().get('key'))
+        )
+        thread.start()
+        thread.join()
+        self.assertEqual(values, ['value'])
+        self.assertEqual(self.make_cache().tier_stats()['l1_hits'], 1)
+
+    def test_excluded_keys_bypass_l1(self):
+        """Ключи-исключения всегда читаются из L2."""
+        cache = self.make_cache(L1_EXCLUDE_PREFIXES=('lock:',))
+        cache.set('lock:page', 1)
+        caches['l2'].delete('lock:page')
+        self.assertIsNone(cache.get('lock:page'))
@@ -0,0 +1,71 @@
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+from django.urls import path
+
+from core.query_budget import (QueryBudgetExceeded, fingerprint,
+                               query_budget, reset_view_query_stats,
+                               view_query_stats)
+
+User = get_user_model()
+
+
+@query_budget(2)
+def users_view(request):
+    # Классический N+1: по запросу на каждого пользователя.
+    for pk in User.objects.values_list('pk', flat=True):
+        User.objects.get(pk=pk)
+    return HttpResponse()
+
+
+urlpatterns = [
+    path('users/', users_view, name='users'),
+]
+
+
+@override_settings(
+    ROOT_URLCONF='core.tests.test_query_budget',
+    QUERY_BUDGET_SERVER_TIMING=True,
+)
+class QueryBudgetTest(TestCase):
+    def setUp(self):
+        reset_view_query_stats()
+        User.objects.create_user(username='first')
+
+    def test_within_budget(self):
+        """В бюджете запрос проходит, счётчики view растут."""
+        response = self.client.get('/users/')
+        self.assertIn('desc="2 queries"', response['Server-Timing'])
+        self.assertEqual(view_query_stats()['users']['queries'], 2)
+        self.assertEqual(view_query_stats()['users']['over_budget'], 0)
+
+    def test_over_budget_fails_in_strict_mode(self):
+        """В тестах превышение бюджета роняет запрос с отпечатками."""
+        User.objects.create_user(username='second')
+        with self.assertRaisesMessage(
+            QueryBudgetExceeded, 'users: 3 запросов'
+        ) as context:
+            self.client.get('/users/')
+        self.assertIn('2× ', str(context.exception))
+
+    @override_settings(QUERY_BUDGET_STRICT=False)
+    def test_over_budget_logged_in_production(self):
+        """На сервере превышение пишется в лог, ответ отдаётся."""
+        User.objects.create_user(username='second')
+        with self.assertLogs('core.query_budget', 'WARNING') as logs:
+            response = self.client.get('/users/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('2× ', logs.output[0])
+        self.assertIn('WHERE "auth_user"."id" = ?', logs.output[0])
+        self.assertEqual(view_query_stats()['users']['over_budget'], 1)
+
+    def test_fingerprint(self):
+        """Отпечаток не зависит от значений в запросе."""
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE a = 'x' AND b IN (1, 2, 3)"),
+            fingerprint("SELECT * FROM t WHERE a = 'y'  AND b IN (4, 5)"),
+        )
+        self.assertEqual(
+            fingerprint('SELECT "t2"."id" FROM t2 WHERE id = %s LIMIT 21'),
+            'SELECT "t2"."id" FROM t2 WHERE id = ? LIMIT ?',
+        )
@@ -0,0 +1,42 @@
+import shutil
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase
+
+from core.storage import ContentAddressedStorage
+
+
+class ContentAddressedStorageTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.storage = ContentAddressedStorage(location=self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_sharded_hashed_name(self):
+        """Файл называется по хешу и лежит в двух уровнях каталогов."""
+        name = self.storage.save('posts/Photo.JPG', ContentFile(b'photo'))
+        self.assertRegex(
+            name, r'^posts/([0-9a-f]{2})/([0-9a-f]{2})/\1\2[0-9a-f]{60}\.jpg$'
+        )
+        self.assertTrue(self.storage.is_hashed(name))
+        self.assertFalse(self.storage.is_hashed('posts/Photo.JPG'))
+        with self.storage.open(name) as file:
+            self.assertEqual(file.read(), b'photo')
+
+    def test_identical_uploads_deduplicated(self):
+        """Одинаковое содержимое хранится один раз."""
+        first = self.storage.save('posts/a.png', ContentFile(b'same'))
+        second = self.storage.save('posts/b.png', ContentFile(b'same'))
+        other = self.storage.save('posts/c.png', ContentFile(b'other'))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+
+    def test_resave_keeps_directory(self):
+        """Пересохранение хешированного имени не вкладывает шарды."""
+        name = self.storage.save('posts/a.png', ContentFile(b'first'))
+        resaved = self.storage.save(name, ContentFile(b'second'))
+        self.assertEqual(resaved.count('/'), 3)
+        self.assertTrue(resaved.startswith('posts/'))
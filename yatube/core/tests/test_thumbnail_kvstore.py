@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+
+from core.cache.thumbnail_kvstore import KVStore
+
+
+@override_settings(
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'thumbnails': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'thumbnail-kvstore',
+        },
+    },
+    THUMBNAIL_CACHE='thumbnails',
+)
+class ThumbnailKVStoreTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = caches['thumbnails']
+        self.cache.clear()
+        with override_settings(THUMBNAIL_INDEX_FILE=os.path.join(
+            self.directory, 'thumbnails.sqlite3'
+        )):
+            self.kvstore = KVStore()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_write_through_to_index(self):
+        """Запись видна в кеше, а после его очистки — из индекса."""
+        self.kvstore._set_raw('sorl-thumbnail||image||a', '{"size": 1}')
+        self.assertEqual(self.cache.get('sorl-thumbnail||image||a'),
+                         '{"size": 1}')
+        self.cache.clear()
+        self.assertEqual(
+            self.kvstore._get_raw('sorl-thumbnail||image||a'), '{"size": 1}'
+        )
+        self.assertEqual(self.cache.get('sorl-thumbnail||image||a'),
+                         '{"size": 1}')
+        self.assertIsNone(self.kvstore._get_raw('sorl-thumbnail||image||b'))
+        self.assertEqual(
+            self.kvstore._find_keys_raw('sorl-thumbnail||image||'),
+            ['sorl-thumbnail||image||a'],
+        )
+        self.kvstore._delete_raw('sorl-thumbnail||image||a')
+        self.assertIsNone(self.kvstore._get_raw('sorl-thumbnail||image||a'))
+
+    def test_warm(self):
+        """Прогрев загружает в кеш весь индекс."""
+        self.kvstore.import_rows([('a', '1'), ('b', '2')])
+        self.assertEqual(self.kvstore.warm(), 2)
+        self.assertEqual(self.cache.get_many(['a', 'b']), {'a': '1', 'b': '2'})
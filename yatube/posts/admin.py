@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from .models import Comment, Follow, Group, Post
+from . import search
+from .models import Comment, Follow, Group, Post, Tag
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -16,6 +17,26 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def save_model(self, request, obj, form, change):
+        # Как и post_edit, правка не затирает счётчик комментариев
+        # и картинку, заменённую воркером после загрузки формы.
+        if change:
+            obj.save(update_fields=form.changed_data)
+        else:
+            super().save_model(request, obj, form, change)
+
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск идёт по индексу FTS5 вместо LIKE по всей таблице.
+        if not search_term or not search.available():
+            return super().get_search_results(
+                request, queryset, search_term
+            )
+        if search.match_query(search_term) is None:
+            return queryset.none(), False
+        return queryset.filter(
+            id__in=search.matching_ids(search_term)
+        ), False
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = (
@@ -45,7 +66,16 @@ class FollowAdmin(admin.ModelAdmin):
     search_fields = ('user__username',)
 
 
+class TagAdmin(admin.ModelAdmin):
+    list_display = (
+        'slug',
+        'posts_count',
+    )
+    search_fields = ('slug',)
+
+
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group, GroupAdmin)
 admin.site.register(Comment, CommentAdmin)
 admin.site.register(Follow, FollowAdmin)
+admin.site.register(Tag, TagAdmin)
@@ -0,0 +1,192 @@
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F
+
+from .models import FeedEntry, Follow, Post, UserStats
+from .utils import (CURSOR_PARAM, CURSOR_PREVIOUS, CursorPaginator,
+                    decode_cursor, pagination)
+
+CELEBRITIES_CACHE_KEY = 'feed:celebrities'
+CELEBRITIES_LOCK_KEY = 'lock:feed:celebrities'
+# Посты с одинаковой датой упорядочиваются по post_id записи ленты:
+# так вся сортировка идёт по индексу ленты.
+FEED_TIEBREAK = 'feed_post'
+
+
+def authors_over_threshold(threshold):
+    """Авторы, у которых подписчиков больше threshold, с их числом."""
+    return Follow.objects.values('author').annotate(
+        followers=Count('id')
+    ).filter(followers__gt=threshold).order_by('-followers')
+
+
+def celebrity_ids():
+    """Множество id авторов, чьи посты подтягиваются в ленту при чтении.
+
+    Набор берётся из кеша, который пишет feed_celebrities --refresh.
+    Пока его нет, набор читается по индексу из счётчиков UserStats
+    и кешируется на FEED_CELEBRITIES_TIMEOUT; агрегат по подпискам
+    и дозаполнение лент в запросах не выполняются.
+    """
+    threshold = settings.FEED_PULL_THRESHOLD
+    if threshold is None:
+        return frozenset()
+    celebrities = cache.get(CELEBRITIES_CACHE_KEY)
+    if celebrities is None:
+        celebrities = frozenset(UserStats.objects.filter(
+            followers_count__gt=threshold
+        ).values_list('user_id', flat=True))
+        cache.set(
+            CELEBRITIES_CACHE_KEY, celebrities,
+            settings.FEED_CELEBRITIES_TIMEOUT,
+        )
+    return celebrities
+
+
+def refresh_celebrities():
+    """Пересчитывает авторов-знаменитостей и кладёт их в кеш без срока.
+
+    Пока автор был знаменитостью, его посты и подписки на него в ленты
+    не раскладывались. Авторам, вышедшим из прошлого набора, ленты
+    подписчиков дозаполняются, иначе эти посты пропали бы из ленты.
+    Пересчёт идёт под блокировкой в кеше; если она уже взята,
+    возвращается None.
+    """
+    if not cache.add(
+        CELEBRITIES_LOCK_KEY, 1, settings.FEED_CELEBRITIES_LOCK_TIMEOUT
+    ):
+        return None
+    try:
+        threshold = settings.FEED_PULL_THRESHOLD
+        celebrities = frozenset()
+        if threshold is not None:
+            celebrities = frozenset(
+                row['author'] for row in authors_over_threshold(threshold)
+            )
+        previous = cache.get(CELEBRITIES_CACHE_KEY, frozenset())
+        cache.set(CELEBRITIES_CACHE_KEY, celebrities, None)
+        for author_id in previous - celebrities:
+            backfill_followers(author_id)
+    finally:
+        cache.delete(CELEBRITIES_LOCK_KEY)
+    return celebrities
+
+
+def fan_out_post(post):
+    """Раскладывает новый пост в ленты всех подписчиков автора."""
+    if post.author_id in celebrity_ids():
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+            for user_id in followers.iterator()
+        ),
+        batch_size=settings.FEED_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill_feed(user_id, author_id):
+    """Добавляет в ленту последние посты автора после подписки."""
+    if author_id in celebrity_ids():
+        return
+    _fill_feeds([user_id], author_id)
+
+
+def backfill_followers(author_id):
+    """Раскладывает последние посты автора по лентам всех подписчиков."""
+    _fill_feeds(
+        Follow.objects.filter(author_id=author_id).values_list(
+            'user_id', flat=True
+        ).iterator(),
+        author_id,
+    )
+
+
+def _fill_feeds(user_ids, author_id):
+    posts = list(Post.objects.filter(author_id=author_id).values_list(
+        'id', 'pub_date'
+    )[:settings.FEED_BACKFILL_LIMIT])
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+            for user_id in user_ids
+            for post_id, pub_date in posts
+        ),
+        batch_size=settings.FEED_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def trim_feed(user_id, author_id):
+    """Убирает из ленты посты автора после отписки."""
+    FeedEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+
+
+def feed_posts(user):
+    """Посты ленты пользователя; сортировка идёт по индексу ленты."""
+    return Post.objects.select_related('author', 'group').filter(
+        feed_entries__user=user
+    ).annotate(
+        feed_date=F('feed_entries__pub_date'),
+        feed_post=F('feed_entries__post'),
+    )
+
+
+def followed_posts(user):
+    """Посты авторов, на которых подписан user, одним JOIN через Follow."""
+    return Post.objects.select_related('author', 'group').filter(
+        author__following__user=user
+    )
+
+
+def feed_page(request, user, posts_per_page=10):
+    """Страница ленты подписок.
+
+    Посты обычных авторов уже лежат в ленте (push), посты авторов
+    с большим числом подписчиков читаются из Post (pull). Источники
+    сливаются merge по (pub_date, id), из каждого берётся не больше
+    posts_per_page + 1 постов. Число запросов не зависит от того,
+    на скольких авторов подписан пользователь.
+    """
+    celebrities = celebrity_ids()
+    if not celebrities or not Follow.objects.filter(
+        user=user, author_id__in=celebrities
+    ).exists():
+        return pagination(
+            request, feed_posts(user), posts_per_page, key='feed_date',
+            tiebreak=FEED_TIEBREAK,
+        )
+    cursor = request.GET.get(CURSOR_PARAM)
+    position = decode_cursor(cursor) if cursor else None
+    direction = position[0] if position else None
+    sources = (
+        CursorPaginator(
+            feed_posts(user), posts_per_page, 'feed_date', FEED_TIEBREAK
+        ),
+        CursorPaginator(
+            followed_posts(user).filter(author_id__in=celebrities),
+            posts_per_page,
+        ),
+    )
+    merged = heapq.merge(
+        *(source.window(position) for source in sources),
+        key=lambda post: (post.pub_date, post.pk),
+        reverse=direction != CURSOR_PREVIOUS,
+    )
+    seen = set()
+    unique = (
+        post for post in merged
+        if post.pk not in seen and not seen.add(post.pk)
+    )
+    return sources[-1].build_page(
+        list(islice(unique, posts_per_page + 1)), direction
+    )
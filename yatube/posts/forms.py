@@ -1,6 +1,7 @@
 from django import forms
 
 from .models import Comment, Post
+from .thumbnails import image_size
 
 
 class PostForm(forms.ModelForm):
@@ -16,6 +17,41 @@ class PostForm(forms.ModelForm):
             'group': 'Группа, к которой будет относиться пост',
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Файл, отброшенный ImageLimitUploadHandler, до ImageField
+        # не доходит: вместо него форма покажет причину.
+        self.upload_error = getattr(
+            self.files.get('image'), 'upload_error', None
+        )
+        if self.upload_error is not None:
+            self.files = self.files.copy()
+            del self.files['image']
+
+    def clean_image(self):
+        if self.upload_error is not None:
+            raise forms.ValidationError(self.upload_error, code='upload_limit')
+        return self.cleaned_data['image']
+
+    def save(self, commit=True):
+        update_fields = [
+            field for field in self._meta.fields if field != 'image'
+        ]
+        if self.is_valid() and 'image' in self.changed_data:
+            metadata = image_size(self.cleaned_data['image'])
+            for field, value in metadata.items():
+                setattr(self.instance, field, value)
+            update_fields += ['image', *metadata]
+        if not commit or self.instance._state.adding:
+            return super().save(commit)
+        # Правка пишет только поля формы: счётчик комментариев и картинку,
+        # которую заменяет воркер, обновляют свои UPDATE, и копия поста
+        # из начала запроса не должна их затереть.
+        post = super().save(commit=False)
+        post.save(update_fields=update_fields)
+        self._save_m2m()
+        return post
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
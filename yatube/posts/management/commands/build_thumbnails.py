@@ -0,0 +1,41 @@
+from functools import partial
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.cache.pages import bump_version
+from posts.models import Post
+from posts.signals import POSTS_VERSION
+from posts.thumbnails import build_thumbnails, create_pool
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит превью всех размеров из POST_THUMBNAIL_SIZES '
+        'для уже загруженных картинок постов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.POST_THUMBNAIL_WORKERS,
+            help='Число процессов; 0 — строить в текущем процессе.',
+        )
+
+    def handle(self, *args, **options):
+        posts = list(
+            Post.objects.exclude(image='').values_list('id', 'image')
+        )
+        if not posts:
+            self.stdout.write('Постов с картинками нет.')
+            return
+        # Общая версия постов сбрасывается один раз на весь проход,
+        # а не за каждый пост.
+        build = partial(build_thumbnails, bump_posts=False)
+        if options['workers']:
+            with create_pool(options['workers']) as pool:
+                list(pool.map(build, *zip(*posts)))
+        else:
+            for post_id, name in posts:
+                build(post_id, name)
+        bump_version(POSTS_VERSION)
+        self.stdout.write(f'Превью построены для постов: {len(posts)}')
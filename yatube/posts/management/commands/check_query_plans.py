@@ -0,0 +1,154 @@
+import inspect
+import re
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+
+from posts.feed import FEED_TIEBREAK, feed_posts
+from posts.models import Comment, Follow, Group, Post, Tag
+from posts.tags import TAG_TIEBREAK, tagged_posts
+from posts.utils import CURSOR_PARAM, CursorPaginator, encode_cursor
+
+# Полный проход по таблице без индекса и сортировка во временном
+# B-дереве. Проход по индексу (SCAN … USING INDEX) проблемой
+# не считается: так читаются страницы в порядке индекса до LIMIT
+# и считается COUNT(*) для номеров страниц.
+FULL_SCAN = re.compile(r'\bSCAN (TABLE )?\w+( AS \w+)?$')
+TEMP_SORT = re.compile(r'\bUSE TEMP B-TREE\b')
+
+DUMMY_CACHES = {
+    alias: {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+    for alias in settings.CACHES
+}
+
+# Запросы, которым полный проход или сортировка нужны по смыслу,
+# а не из-за нехватки индекса, с кусочком их SQL:
+ALLOWED = (
+    # выдача поиска упорядочена по релевантности bm25.
+    ('posts:search', 'bm25('),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Выполняет EXPLAIN QUERY PLAN для каждого запроса страниц постов '
+        'и завершается ошибкой, если какой-то из них читает таблицу '
+        'целиком или сортирует во временном B-дереве.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verbose-plans', action='store_true',
+            help='Печатать план каждого запроса',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Планы проверяются только на SQLite.')
+        failures = 0
+        checked = 0
+        for view_name, url, user in self.requests():
+            for sql, plan in self.plans(url, user):
+                checked += 1
+                problems = [
+                    line for line in plan
+                    if FULL_SCAN.search(line) or TEMP_SORT.search(line)
+                ]
+                if problems and self.allowed(view_name, sql):
+                    problems = []
+                if problems:
+                    failures += 1
+                    self.stdout.write(self.style.ERROR(f'{view_name}: {sql}'))
+                elif options['verbose_plans']:
+                    self.stdout.write(f'{view_name}: {sql}')
+                if problems or options['verbose_plans']:
+                    for line in plan:
+                        self.stdout.write(f'    {line}')
+        if failures:
+            raise CommandError(
+                f'Запросов с полным проходом или сортировкой: {failures} '
+                f'из {checked}'
+            )
+        self.stdout.write(f'Проверено запросов: {checked}, проблем нет')
+
+    @staticmethod
+    def allowed(view_name, sql):
+        return any(
+            view_name == allowed_view and fragment in sql
+            for allowed_view, fragment in ALLOWED
+        )
+
+    def requests(self):
+        """Адреса всех страниц постов на примерах из базы.
+
+        У каждого списка проверяется и первая страница, и страница
+        по курсору: у неё свой план с условием по ключу.
+        """
+        post = Post.objects.order_by('-comments_count').first()
+        if post is None:
+            raise CommandError('В базе нет постов, планы не на чем строить.')
+        group = Group.objects.first()
+        tag = Tag.objects.order_by('-posts_count').first()
+        follow = Follow.objects.order_by('user').first()
+        reader = follow.user if follow else post.author
+        listings = [
+            ('posts:index', [], None, Post.objects.all(), 'pub_date', 'pk'),
+            (
+                'posts:profile', [post.author.username], reader,
+                Post.objects.filter(author=post.author), 'pub_date', 'pk',
+            ),
+            (
+                'posts:post_comments', [post.pk], None,
+                Comment.objects.filter(post=post), 'created', 'pk',
+            ),
+            (
+                'posts:follow_index', [], reader,
+                feed_posts(reader), 'feed_date', FEED_TIEBREAK,
+            ),
+        ]
+        if group is not None:
+            listings.append((
+                'posts:group_list', [group.slug], None,
+                group.posts.all(), 'pub_date', 'pk',
+            ))
+        if tag is not None:
+            listings.append((
+                'posts:tag_posts', [tag.slug], None,
+                tagged_posts(tag), 'tag_date', TAG_TIEBREAK,
+            ))
+        yield 'posts:post_detail', reverse(
+            'posts:post_detail', args=[post.pk]
+        ), reader
+        for view_name, args, user, objects, key, tiebreak in listings:
+            url = reverse(view_name, args=args)
+            yield view_name, url, user
+            first = CursorPaginator(objects, 1, key, tiebreak).window(None)
+            if first:
+                cursor = encode_cursor(first[0], key=key)
+                yield view_name, f'{url}?{CURSOR_PARAM}={cursor}', user
+        yield 'posts:search', reverse('posts:search') + '?q=a', None
+
+    def plans(self, url, user):
+        """Пары (SQL, строки плана) для всех SELECT, выполненных view."""
+        request = RequestFactory().get(url)
+        request.user = user or AnonymousUser()
+        match = resolve(request.path_info)
+        request.resolver_match = match
+        # Кеш страниц и проверка входа не нужны: важны только запросы,
+        # и все они должны выполниться, а не прийти из кеша.
+        view = inspect.unwrap(match.func)
+        with override_settings(CACHES=DUMMY_CACHES):
+            with CaptureQueriesContext(connection) as queries:
+                view(request, *match.args, **match.kwargs)
+        with connection.cursor() as cursor:
+            for query in queries:
+                sql = query['sql']
+                if not sql.lstrip().upper().startswith('SELECT'):
+                    continue
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                yield sql, [row[-1] for row in cursor.fetchall()]
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts.feed import authors_over_threshold, refresh_celebrities
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Показывает авторов, у которых подписчиков больше порога '
+        'FEED_PULL_THRESHOLD: их посты подмешиваются в ленту при чтении.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threshold', type=int, default=None,
+            help='Порог числа подписчиков вместо FEED_PULL_THRESHOLD.',
+        )
+        parser.add_argument(
+            '--refresh', action='store_true',
+            help='Пересчитать закешированный список таких авторов '
+                 'и дозаполнить ленты подписчиков тех, кто из него вышел.',
+        )
+
+    def handle(self, *args, **options):
+        if options['refresh'] and refresh_celebrities() is None:
+            self.stderr.write('Список уже пересчитывается другим процессом.')
+        threshold = options['threshold']
+        if threshold is None:
+            threshold = settings.FEED_PULL_THRESHOLD
+        if threshold is None:
+            self.stdout.write('Гибридная лента выключена.')
+            return
+        rows = list(authors_over_threshold(threshold))
+        usernames = dict(User.objects.filter(
+            id__in=[row['author'] for row in rows]
+        ).values_list('id', 'username'))
+        for row in rows:
+            self.stdout.write(
+                f'{usernames[row["author"]]}\t{row["followers"]}'
+            )
+        self.stdout.write(
+            f'Авторов с подписчиками больше {threshold}: {len(rows)}'
+        )
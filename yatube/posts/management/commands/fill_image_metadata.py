@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+
+from core.cache.pages import bump_version
+from posts.models import Post
+from posts.signals import POSTS_VERSION
+from posts.thumbnails import image_metadata
+
+FIELDS = ('image_width', 'image_height', 'image_placeholder')
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет размеры и заглушку картинки у постов, '
+        'загруженных до появления этих полей.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересчитать и уже заполненные посты.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').only('id', 'image')
+        if not options['all']:
+            posts = posts.filter(image_width__isnull=True)
+        batch = []
+        filled = missing = 0
+        for post in posts.iterator():
+            try:
+                with post.image.open('rb') as file:
+                    metadata = image_metadata(file)
+            except (OSError, ValueError):
+                missing += 1
+                continue
+            for field, value in metadata.items():
+                setattr(post, field, value)
+            batch.append(post)
+            if len(batch) >= options['batch_size']:
+                filled += self.update(batch)
+                batch = []
+        if batch:
+            filled += self.update(batch)
+        if filled:
+            bump_version(POSTS_VERSION)
+        self.stdout.write(
+            f'Заполнено постов: {filled}, картинок не прочитано: {missing}'
+        )
+
+    def update(self, batch):
+        # bulk_update не шлёт сигналов: карточки постов сбрасываются тут.
+        Post.objects.bulk_update(batch, FIELDS)
+        for post in batch:
+            bump_version(f'post:{post.pk}')
+        return len(batch)
@@ -0,0 +1,440 @@
+import multiprocessing
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from importlib import import_module
+from io import BytesIO
+from urllib.parse import urlencode
+from wsgiref.util import setup_testing_defaults
+
+import django
+from django.conf import settings
+from django.contrib.auth import (BACKEND_SESSION_KEY, HASH_SESSION_KEY,
+                                 SESSION_KEY)
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import got_request_exception
+from django.db import OperationalError, connections
+from django.middleware.csrf import CSRF_ALLOWED_CHARS, CSRF_TOKEN_LENGTH
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+
+from core.benchmarks import PERCENTILES, percentile
+from core.cache.pages import (EVENTS, flush_page_cache_stats,
+                              page_cache_stats)
+from posts.models import Post, User, UserStats
+from posts.utils import CURSOR_PARAM, encode_cursor
+
+OPERATIONS = ('index', 'feed', 'post', 'comment', 'follow')
+DEFAULT_MIX = 'index=60,feed=25,post=5,comment=7,follow=3'
+# Верхние границы корзин гистограммы задержек, мс.
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+BAR_WIDTH = 40
+# Постов на странице главной, как у pagination() по умолчанию.
+INDEX_PAGE_SIZE = 10
+
+_local = threading.local()
+
+
+def parse_mix(value):
+    """'index=60,feed=25' -> {'index': 60, 'feed': 25}."""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise CommandError(
+                f'Неизвестная операция {name!r}, есть: {", ".join(OPERATIONS)}'
+            )
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise CommandError(f'Вес операции {name} — не число: {weight!r}')
+    if sum(mix.values()) <= 0:
+        raise CommandError('Сумма весов операций должна быть больше нуля')
+    return mix
+
+
+def is_lock_error(error):
+    return (
+        isinstance(error, OperationalError)
+        and 'database is locked' in str(error)
+    )
+
+
+def remember_error(sender, request=None, **kwargs):
+    # Сигнал шлётся из except в обработчике Django: исключение ещё
+    # доступно, хотя клиент получит только ответ 500.
+    _local.error = sys.exc_info()[1]
+
+
+def bucket(milliseconds):
+    for limit in BUCKETS:
+        if milliseconds <= limit:
+            return limit
+    return None
+
+
+def tier_stats():
+    """Счётчики уровней TieredCache этого процесса, если он настроен."""
+    stats = getattr(caches[settings.PAGE_CACHE_ALIAS], 'tier_stats', None)
+    if stats is None:
+        return Counter()
+    return Counter({
+        key: value for key, value in stats().items()
+        if not key.endswith('_ratio')
+    })
+
+
+class LoadClient:
+    """Один посетитель: шлёт запросы прямо в WSGI-приложение."""
+
+    def __init__(self, application, plan, number):
+        self.application = application
+        self.plan = plan
+        self.rng = random.Random(plan['seed'] * 1000 + number)
+        # У каждого клиента свои сессии, поэтому он точно знает,
+        # на кого из авторов сам подписался.
+        self.sessions = plan['sessions'][number::plan['clients']] or [
+            plan['sessions'][number % len(plan['sessions'])]
+        ]
+        self.followed = set()
+        self.operations = list(plan['mix'])
+        self.weights = [plan['mix'][name] for name in self.operations]
+
+    def run(self, deadline):
+        samples = []
+        limit = self.plan['requests']
+        while time.monotonic() < deadline and (
+            limit is None or len(samples) < limit
+        ):
+            operation = self.rng.choices(self.operations, self.weights)[0]
+            method, path, query, data, session = getattr(self, operation)()
+            started = time.perf_counter()
+            status, error = self.call(method, path, query, data, session)
+            samples.append((
+                operation, time.perf_counter() - started, status,
+                is_lock_error(error),
+            ))
+        connections.close_all()
+        return samples
+
+    def call(self, method, path, query, data, session):
+        body = urlencode(data or {}).encode()
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'HTTP_HOST': self.plan['host'],
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': BytesIO(body),
+        }
+        if data is not None:
+            environ['CONTENT_TYPE'] = 'application/x-www-form-urlencoded'
+        if session is not None:
+            key, csrf_token, _ = session
+            environ['HTTP_COOKIE'] = (
+                f'{settings.SESSION_COOKIE_NAME}={key}; '
+                f'{settings.CSRF_COOKIE_NAME}={csrf_token}'
+            )
+            environ[settings.CSRF_HEADER_NAME] = csrf_token
+        setup_testing_defaults(environ)
+        statuses = []
+
+        def start_response(status, headers, exc_info=None):
+            statuses.append(int(status.split()[0]))
+
+        _local.error = None
+        response = self.application(environ, start_response)
+        try:
+            for _ in response:
+                pass
+        finally:
+            # close() шлёт request_finished: соединение с базой
+            # закрывается так же, как на сервере.
+            response.close()
+        return statuses[0], _local.error
+
+    def session(self):
+        return self.rng.choice(self.sessions)
+
+    def index(self):
+        # Глубокие страницы открываются по курсору, как по ссылкам сайта.
+        cursors = self.plan['index_cursors']
+        page = int((len(cursors) + 1) ** self.rng.random())
+        query = f'{CURSOR_PARAM}={cursors[page - 2]}' if page > 1 else ''
+        return 'GET', reverse('posts:index'), query, None, None
+
+    def feed(self):
+        return 'GET', reverse('posts:follow_index'), '', None, self.session()
+
+    def post(self):
+        text = ' '.join(self.rng.choices(self.plan['words'], k=12))
+        return (
+            'POST', reverse('posts:post_create'), '',
+            {'text': f'{text} #нагрузка'}, self.session(),
+        )
+
+    def comment(self):
+        post_id = self.plan['posts'][
+            int(len(self.plan['posts']) ** self.rng.random()) - 1
+        ]
+        return (
+            'POST', reverse('posts:add_comment', args=[post_id]), '',
+            {'text': 'Комментарий под нагрузкой'}, self.session(),
+        )
+
+    def follow(self):
+        session = self.session()
+        authors = [
+            author for author in self.plan['authors'] if author != session[2]
+        ]
+        if not authors:
+            return self.feed()
+        author = self.rng.choice(authors)
+        if (session, author) in self.followed:
+            self.followed.discard((session, author))
+            name = 'posts:profile_unfollow'
+        else:
+            self.followed.add((session, author))
+            name = 'posts:profile_follow'
+        return 'GET', reverse(name, args=[author]), '', None, session
+
+
+def run_clients(plan, first, count):
+    """Гоняет count клиентов в пуле потоков этого процесса."""
+    from yatube.wsgi import application
+
+    got_request_exception.connect(remember_error)
+    tiers = tier_stats()
+    deadline = time.monotonic() + plan['duration']
+    clients = [
+        LoadClient(application, plan, number)
+        for number in range(first, first + count)
+    ]
+    try:
+        if count == 1:
+            results = [clients[0].run(deadline)]
+        else:
+            with ThreadPoolExecutor(max_workers=count) as pool:
+                results = list(pool.map(
+                    lambda client: client.run(deadline), clients
+                ))
+    finally:
+        got_request_exception.disconnect(remember_error)
+        flush_page_cache_stats()
+    return (
+        [sample for samples in results for sample in samples],
+        tier_stats() - tiers,
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест без внешних инструментов: потоки (и по желанию '
+        'процессы) шлют смесь запросов прямо в yatube.wsgi.application. '
+        'Пишет в настроенную базу — запускайте на копии, например после '
+        'seed_scale.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument(
+            '--processes', type=int, default=0,
+            help='Сколько процессов, в каждом по --threads потоков; '
+                 '0 — только потоки этого процесса',
+        )
+        parser.add_argument('--duration', type=float, default=10)
+        parser.add_argument(
+            '--requests', type=int, default=None,
+            help='Не больше стольких запросов на клиента',
+        )
+        parser.add_argument(
+            '--mix', default=DEFAULT_MIX,
+            help=f'Веса операций {", ".join(OPERATIONS)}',
+        )
+        parser.add_argument(
+            '--sessions', type=int, default=50,
+            help='Сколько пользователей входит на сайт',
+        )
+        parser.add_argument('--authors', type=int, default=200)
+        parser.add_argument('--index-pages', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--host', default='127.0.0.1')
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        threads = options['threads']
+        if threads < 1 or processes < 0:
+            raise CommandError('Нужен хотя бы один поток')
+        sessions = self.login(options['sessions'])
+        try:
+            plan = self.plan(options, sessions, max(processes, 1) * threads)
+            cache_before = page_cache_stats()
+            started = time.perf_counter()
+            if processes:
+                with ProcessPoolExecutor(
+                    max_workers=processes,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=django.setup,
+                ) as pool:
+                    runs = [
+                        pool.submit(run_clients, plan, i * threads, threads)
+                        for i in range(processes)
+                    ]
+                    results = [run.result() for run in runs]
+            else:
+                results = [run_clients(plan, 0, threads)]
+            elapsed = time.perf_counter() - started
+        finally:
+            self.logout(sessions)
+        samples = [sample for result, _ in results for sample in result]
+        tiers = sum((tiers for _, tiers in results), Counter())
+        self.report(samples, elapsed, tiers, cache_before)
+
+    def login(self, count):
+        """Сессии пользователей с подписками, как после входа на сайт."""
+        readers = User.objects.filter(
+            follower__isnull=False
+        ).distinct().order_by('pk')[:count]
+        users = list(readers) or list(User.objects.order_by('pk')[:count])
+        if not users:
+            raise CommandError('В базе нет пользователей, нужен seed_scale')
+        store = import_module(settings.SESSION_ENGINE).SessionStore
+        sessions = []
+        for user in users:
+            session = store()
+            session[SESSION_KEY] = user._meta.pk.value_to_string(user)
+            session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+            session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+            session.save()
+            sessions.append((
+                session.session_key,
+                get_random_string(CSRF_TOKEN_LENGTH, CSRF_ALLOWED_CHARS),
+                user.username,
+            ))
+        return sessions
+
+    def logout(self, sessions):
+        store = import_module(settings.SESSION_ENGINE).SessionStore
+        for key, _, _ in sessions:
+            store(key).delete()
+
+    def plan(self, options, sessions, clients):
+        """Всё, что нужно клиентам, простыми данными: план уходит
+        и в дочерние процессы."""
+        posts = list(
+            Post.objects.order_by('-pub_date', '-id')
+            .values_list('pk', flat=True)[:1000]
+        )
+        authors = list(
+            UserStats.objects.filter(posts_count__gt=0)
+            .order_by('-followers_count')
+            .values_list('user__username', flat=True)[:options['authors']]
+        )
+        if not posts or not authors:
+            raise CommandError('В базе нет постов, нужен seed_scale')
+        index_pages = max(options['index_pages'], 1)
+        index_cursors = [
+            encode_cursor(post) for post in list(
+                Post.objects.order_by('-pub_date', '-id').only('pub_date')[
+                    :INDEX_PAGE_SIZE * (index_pages - 1)
+                ]
+            )[INDEX_PAGE_SIZE - 1::INDEX_PAGE_SIZE]
+        ]
+        words = Post.objects.filter(pk=posts[0]).values_list(
+            'text', flat=True
+        ).get().split() or ['текст']
+        return {
+            'mix': parse_mix(options['mix']),
+            'duration': options['duration'],
+            'requests': options['requests'],
+            'index_cursors': index_cursors,
+            'seed': options['seed'],
+            'host': options['host'],
+            'clients': clients,
+            'sessions': sessions,
+            'posts': posts,
+            'authors': authors,
+            'words': words,
+        }
+
+    def report(self, samples, elapsed, tiers, cache_before):
+        if not samples:
+            raise CommandError('Не выполнено ни одного запроса')
+        by_operation = {}
+        for operation, seconds, status, locked in samples:
+            by_operation.setdefault(operation, []).append(
+                (seconds * 1000, status, locked)
+            )
+        self.stdout.write(
+            f'Запросов: {len(samples)} за {elapsed:.1f} с, '
+            f'{len(samples) / elapsed:.1f} в секунду'
+        )
+        self.stdout.write(
+            'операция\tзапросов\tв секунду\t'
+            + '\t'.join(f'p{percent} мс' for percent in PERCENTILES)
+            + '\tошибок\tбаза занята'
+        )
+        for operation in OPERATIONS:
+            rows = by_operation.get(operation)
+            if not rows:
+                continue
+            timings = [milliseconds for milliseconds, _, _ in rows]
+            errors = sum(status >= 400 for _, status, _ in rows)
+            locked = sum(locked for _, _, locked in rows)
+            self.stdout.write(
+                f'{operation}\t{len(rows)}\t{len(rows) / elapsed:.1f}\t'
+                + '\t'.join(
+                    f'{percentile(timings, percent):.1f}'
+                    for percent in PERCENTILES
+                )
+                + f'\t{errors}\t{locked}'
+            )
+        for operation in OPERATIONS:
+            if operation in by_operation:
+                self.histogram(operation, [
+                    milliseconds for milliseconds, _, _ in
+                    by_operation[operation]
+                ])
+        self.cache_report(tiers, cache_before)
+
+    def histogram(self, operation, timings):
+        counts = Counter(bucket(milliseconds) for milliseconds in timings)
+        widest = max(counts.values())
+        self.stdout.write(f'\nЗадержка {operation}:')
+        for limit in BUCKETS + (None,):
+            if not counts[limit]:
+                continue
+            label = f'≤{limit}' if limit else f'>{BUCKETS[-1]}'
+            bar = '#' * max(round(counts[limit] / widest * BAR_WIDTH), 1)
+            self.stdout.write(
+                f'{label:>6} мс {counts[limit]:>7} {bar}'
+            )
+
+    def cache_report(self, tiers, cache_before):
+        self.stdout.write('\nКеш страниц:')
+        self.stdout.write('\t'.join(('view',) + EVENTS + ('попаданий',)))
+        for view, counters in page_cache_stats().items():
+            before = cache_before.get(view, {})
+            delta = {
+                event: counters[event] - before.get(event, 0)
+                for event in EVENTS
+            }
+            served = delta['hit'] + delta['miss'] + delta['stale']
+            if not served:
+                continue
+            self.stdout.write('\t'.join(
+                [view] + [str(delta[event]) for event in EVENTS]
+                + [f'{(delta["hit"] + delta["stale"]) / served:.1%}']
+            ))
+        total = sum(tiers.values())
+        if total:
+            self.stdout.write(
+                f'Уровни кеша: L1 {tiers["l1_hits"] / total:.1%}, '
+                f'L2 {tiers["l2_hits"] / total:.1%}, '
+                f'промахи {tiers["misses"] / total:.1%}'
+            )
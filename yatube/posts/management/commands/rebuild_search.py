@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = 'Заново строит поисковый индекс FTS5 по всем постам.'
+
+    def handle(self, *args, **options):
+        if not search.available():
+            self.stdout.write('Поисковый индекс есть только на SQLite.')
+            return
+        self.stdout.write(f'Проиндексировано постов: {search.rebuild()}')
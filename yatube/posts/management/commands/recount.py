@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from posts.stats import recount_all
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает сохранённые счётчики постов, подписчиков, '
+        'подписок и комментариев по исходным таблицам.'
+    )
+
+    def handle(self, *args, **options):
+        users, posts = recount_all()
+        self.stdout.write(
+            f'Пересчитано пользователей: {users}, постов: {posts}'
+        )
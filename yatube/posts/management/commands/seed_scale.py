@@ -0,0 +1,379 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from io import BytesIO
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Max, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from PIL import Image
+
+from core.cache.pages import bump_version
+from posts import search
+from posts.feed import authors_over_threshold, refresh_celebrities
+from posts.models import (Comment, FeedEntry, Follow, Group, Post, PostTag,
+                          Tag, User)
+from posts.signals import COMMENTS_VERSION, FOLLOWS_VERSION, POSTS_VERSION
+from posts.stats import recount_all
+from posts.tags import TRENDING_CACHE_KEY
+from posts.thumbnails import image_metadata
+
+WORDS = (
+    'лес река поле город утро вечер дорога дом небо море гора снег '
+    'дождь солнце книга кофе музыка фото поход друг кот собака сад '
+    'работа отпуск поезд мост ветер облако звезда весна лето осень зима'
+).split()
+IMAGE_SIZES = ((1200, 800), (800, 1200), (1600, 900), (1024, 1024))
+# Сколько попыток степенного выбора авторов на одну нужную подписку.
+FOLLOW_DRAWS = 10
+
+FEED_SQL = (
+    f'INSERT OR IGNORE INTO {FeedEntry._meta.db_table}'
+    ' (user_id, post_id, pub_date)'
+    ' SELECT follow.user_id, post.id, post.pub_date'
+    f' FROM {Follow._meta.db_table} follow'
+    f' JOIN {Post._meta.db_table} post ON post.author_id = follow.author_id'
+    ' WHERE follow.id BETWEEN %s AND %s'
+)
+
+
+def power_law(rng, size):
+    """Индекс от 0 до size - 1; вероятность падает примерно как 1 / k."""
+    return int((size + 1) ** rng.random()) - 1
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+@contextmanager
+def explicit_dates(*fields):
+    """Отключает auto_now_add, чтобы bulk_create записал свои даты."""
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = (
+        'Быстро наполняет базу синтетическими данными: пользователи, '
+        'группы, посты (по желанию с картинками), комментарии и граф '
+        'подписок со степенным распределением. Одинаковый --seed даёт '
+        'одинаковые данные.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10_000)
+        parser.add_argument('--groups', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=1_000_000)
+        parser.add_argument('--comments', type=int, default=3_000_000)
+        parser.add_argument(
+            '--follows', type=int, default=30,
+            help='Сколько в среднем подписок у пользователя',
+        )
+        parser.add_argument('--tags', type=int, default=500)
+        parser.add_argument(
+            '--images', type=float, default=0.0,
+            help='Доля постов с картинкой, от 0 до 1',
+        )
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--chunk-size', type=int, default=10_000)
+        parser.add_argument(
+            '--prefix', default='seed_',
+            help='Начало имён пользователей и адресов групп',
+        )
+        parser.add_argument(
+            '--password', default='yatube-seed',
+            help='Пароль всех созданных пользователей',
+        )
+        parser.add_argument(
+            '--no-feeds', action='store_true',
+            help='Не раскладывать посты по лентам подписчиков',
+        )
+
+    def handle(self, *args, **options):
+        if User.objects.filter(
+            username__startswith=options['prefix']
+        ).exists():
+            raise CommandError(
+                f'Пользователи с префиксом {options["prefix"]} уже есть, '
+                f'укажите другой --prefix'
+            )
+        self.options = options
+        self.chunk_size = options['chunk_size']
+        self.rng = random.Random(options['seed'])
+        self.now = timezone.now()
+        self.start = self.now - timedelta(days=options['days'])
+        started = time.perf_counter()
+        with self.fast_writes():
+            users = self.step('пользователи', self.create_users)
+            groups = self.step('группы', self.create_groups)
+            tags = self.step('теги', self.create_tags)
+            images = self.step('картинки', self.create_images)
+            posts = self.step(
+                'посты', self.create_posts, users, groups, tags, images
+            )
+            self.step('связи с тегами', self.count_tags, tags)
+            self.step('комментарии', self.create_comments, users, posts)
+            follows = self.step('подписки', self.create_follows, users)
+            self.step('счётчики', recount_all)
+            if not options['no_feeds']:
+                self.step('ленты', self.fill_feeds, follows)
+            self.step('поисковый индекс', search.rebuild)
+        for name in (POSTS_VERSION, FOLLOWS_VERSION, COMMENTS_VERSION):
+            bump_version(name)
+        cache.delete(TRENDING_CACHE_KEY)
+        # Запоминает, чьи посты не разложены по лентам.
+        refresh_celebrities()
+        self.stdout.write(
+            f'Готово за {time.perf_counter() - started:.1f} с'
+        )
+
+    @contextmanager
+    def fast_writes(self):
+        # Данные можно сгенерировать заново, так что сбрасывать каждую
+        # транзакцию на диск незачем. Внутри внешней транзакции SQLite
+        # режим менять не даёт — тогда пишем как обычно.
+        if connection.vendor != 'sqlite' or connection.in_atomic_block:
+            yield
+            return
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            synchronous = cursor.fetchone()[0]
+            cursor.execute('PRAGMA synchronous = OFF')
+            try:
+                yield
+            finally:
+                cursor.execute(f'PRAGMA synchronous = {int(synchronous)}')
+
+    def step(self, name, function, *args):
+        started = time.perf_counter()
+        result = function(*args)
+        self.stdout.write(
+            f'{name}: {time.perf_counter() - started:.1f} с'
+        )
+        return result
+
+    def bulk_insert(self, model, objects):
+        """Пишет объекты пачками по транзакции на пачку.
+
+        Возвращает диапазон id новых строк: на SQLite AUTOINCREMENT
+        выдаёт их подряд, пока пишет один процесс.
+        """
+        before = model.objects.aggregate(last=Max('pk'))['last'] or 0
+        total = 0
+        for chunk in chunked(objects, self.chunk_size):
+            with transaction.atomic():
+                model.objects.bulk_create(chunk)
+            total += len(chunk)
+        if not total:
+            return range(0)
+        bounds = model.objects.filter(pk__gt=before).aggregate(
+            first=Min('pk'), last=Max('pk'), count=Count('pk')
+        )
+        if bounds['last'] - bounds['first'] + 1 != bounds['count']:
+            raise CommandError(
+                f'{model.__name__}: id новых строк идут не подряд, '
+                f'база менялась во время генерации'
+            )
+        return range(bounds['first'], bounds['last'] + 1)
+
+    def create_users(self):
+        prefix = self.options['prefix']
+        # Хеш пароля считается один раз: PBKDF2 на каждого
+        # пользователя занял бы часы.
+        password = make_password(self.options['password'])
+        return self.bulk_insert(User, (
+            User(
+                username=f'{prefix}{i}',
+                password=password,
+                date_joined=self.start,
+            )
+            for i in range(self.options['users'])
+        ))
+
+    def create_groups(self):
+        prefix = self.options['prefix'].replace('_', '-')
+        return self.bulk_insert(Group, (
+            Group(
+                title=f'Группа {i}',
+                slug=f'{prefix}group-{i}',
+                description=' '.join(self.rng.choices(WORDS, k=12)),
+            )
+            for i in range(self.options['groups'])
+        ))
+
+    def create_tags(self):
+        """Теги по убыванию популярности: лес, река, …, лес1, река1, …"""
+        slugs = [
+            f'{WORDS[i % len(WORDS)]}{i // len(WORDS) or ""}'
+            for i in range(self.options['tags'])
+        ]
+        Tag.objects.bulk_create(
+            [Tag(slug=slug) for slug in slugs], ignore_conflicts=True
+        )
+        ids = dict(
+            Tag.objects.filter(slug__in=slugs).values_list('slug', 'pk')
+        )
+        return {slug: ids[slug] for slug in slugs}
+
+    def create_images(self):
+        """Несколько картинок, общих для всех постов с картинкой."""
+        if not self.options['images']:
+            return []
+        storage = Post.image.field.storage
+        images = []
+        for i, size in enumerate(IMAGE_SIZES):
+            buffer = BytesIO()
+            color = tuple(self.rng.randrange(256) for _ in range(3))
+            Image.new('RGB', size, color).save(buffer, 'JPEG', quality=80)
+            file = ContentFile(buffer.getvalue(), f'seed-{i}.jpg')
+            name = storage.save(
+                Post.image.field.generate_filename(None, file.name), file
+            )
+            images.append({'image': name, **image_metadata(file)})
+        return images
+
+    def create_posts(self, users, groups, tags, images):
+        options = self.options
+        rng = self.rng
+        count = options['posts']
+        span = (self.now - self.start) / max(count, 1)
+        slugs = list(tags)
+        post_tags = []
+
+        def posts():
+            for i in range(count):
+                words = rng.choices(WORDS, k=rng.randint(5, 60))
+                chosen = {
+                    slugs[power_law(rng, len(slugs))]
+                    for _ in range(rng.randint(0, 3))
+                } if slugs else set()
+                post_tags.append(chosen)
+                image = {}
+                if images and rng.random() < options['images']:
+                    image = rng.choice(images)
+                yield Post(
+                    text=' '.join(words + [f'#{slug}' for slug in chosen]),
+                    pub_date=self.start + span * i,
+                    author_id=users[rng.randrange(len(users))],
+                    group_id=(
+                        groups[power_law(rng, len(groups))]
+                        if groups and rng.random() < 0.6 else None
+                    ),
+                    **image,
+                )
+
+        with explicit_dates(Post._meta.get_field('pub_date')):
+            posts = self.bulk_insert(Post, posts())
+        self.bulk_insert(PostTag, (
+            PostTag(
+                post_id=post_id,
+                tag_id=tags[slug],
+                pub_date=self.start + span * i,
+            )
+            for i, (post_id, chosen) in enumerate(zip(posts, post_tags))
+            for slug in chosen
+        ))
+        return posts
+
+    def count_tags(self, tags):
+        # Теги могли остаться от прошлого запуска: считаются заново.
+        Tag.objects.filter(pk__in=tags.values()).update(
+            posts_count=Coalesce(Subquery(
+                PostTag.objects.filter(tag=OuterRef('pk')).order_by().values(
+                    'tag'
+                ).annotate(total=Count('pk')).values('total')
+            ), 0)
+        )
+
+    def create_comments(self, users, posts):
+        rng = self.rng
+        if not posts:
+            return
+        span = (self.now - self.start) / len(posts)
+
+        def comments():
+            for i in range(self.options['comments']):
+                # Чем свежее пост, тем больше у него комментариев.
+                index = len(posts) - 1 - power_law(rng, len(posts))
+                pub_date = self.start + span * index
+                yield Comment(
+                    post_id=posts[index],
+                    author_id=users[rng.randrange(len(users))],
+                    text=' '.join(rng.choices(WORDS, k=rng.randint(3, 25))),
+                    created=pub_date + (self.now - pub_date) * rng.random(),
+                )
+
+        with explicit_dates(Comment._meta.get_field('created')):
+            self.bulk_insert(Comment, comments())
+
+    def create_follows(self, users):
+        """Граф подписок: на кого подписываются, решает степенной закон,
+        поэтому у немногих авторов очень много подписчиков."""
+        rng = self.rng
+        average = self.options['follows']
+        if len(users) < 2 or not average:
+            return range(0)
+
+        def follows():
+            for user in users:
+                wanted = min(
+                    int(rng.expovariate(1 / average)), len(users) - 1
+                )
+                authors = set()
+                for _ in range(wanted * FOLLOW_DRAWS):
+                    if len(authors) >= wanted:
+                        break
+                    author = users[power_law(rng, len(users))]
+                    if author != user:
+                        authors.add(author)
+                if len(authors) < wanted:
+                    # В маленькой базе степенной выбор почти всегда
+                    # попадает в уже выбранных: добираем остальных.
+                    rest = [
+                        author for author in users
+                        if author != user and author not in authors
+                    ]
+                    authors.update(rng.sample(rest, wanted - len(authors)))
+                for author in sorted(authors):
+                    yield Follow(user_id=user, author_id=author)
+
+        return self.bulk_insert(Follow, follows())
+
+    def fill_feeds(self, follows):
+        """Раскладывает посты по лентам одним INSERT … SELECT на пачку
+        подписок; авторов-знаменитостей лента читает сама."""
+        threshold = settings.FEED_PULL_THRESHOLD
+        celebrities = []
+        if threshold is not None:
+            celebrities = [
+                row['author'] for row in authors_over_threshold(threshold)
+            ]
+        sql = FEED_SQL
+        if celebrities:
+            sql += ' AND follow.author_id NOT IN ({})'.format(
+                ', '.join(map(str, celebrities))
+            )
+        step = max(self.chunk_size // 100, 1)
+        for first in range(follows.start, follows.stop, step):
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(sql, [first, first + step - 1])
@@ -0,0 +1,58 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.cache.pages import bump_version
+from posts.models import Post
+from posts.signals import POSTS_VERSION
+from posts.thumbnails import delete_unused_image, thumbnail_key
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит картинки постов из плоского каталога в хранилище, '
+        'адресуемое по содержимому, и переписывает пути в постах.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        storage = Post.image.field.storage
+        names = [
+            name for name in Post.objects.exclude(image='').values_list(
+                'image', flat=True
+            ).distinct().iterator()
+            if not storage.is_hashed(name)
+        ]
+        batch_size = options['batch_size']
+        moved = missing = 0
+        for start in range(0, len(names), batch_size):
+            renames = {}
+            for name in names[start:start + batch_size]:
+                if not storage.exists(name):
+                    missing += 1
+                    continue
+                with storage.open(name) as file:
+                    renames[name] = storage.save(name, file)
+            with transaction.atomic():
+                for old, new in renames.items():
+                    Post.objects.filter(image=old).update(image=new)
+            for old, new in renames.items():
+                self.move_thumbnails(old, new)
+                delete_unused_image(old)
+            moved += len(renames)
+        if moved:
+            bump_version(POSTS_VERSION)
+        self.stdout.write(
+            f'Перенесено картинок: {moved}, не найдено файлов: {missing}'
+        )
+
+    def move_thumbnails(self, old, new):
+        # Превью уже построены: их достаточно найти по новому имени.
+        cache = caches[settings.PAGE_CACHE_ALIAS]
+        for size in settings.POST_THUMBNAIL_SIZES:
+            thumbnail = cache.get(thumbnail_key(old, size))
+            if thumbnail is not None:
+                cache.set(thumbnail_key(new, size), thumbnail, None)
@@ -0,0 +1,210 @@
+import json
+import os
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import (CaptureQueriesContext,
+                               setup_test_environment,
+                               teardown_test_environment)
+from django.urls import reverse
+
+from core.benchmarks import PERCENTILES, percentile
+from posts.models import Comment, Follow, Group, Post, User
+
+DEFAULT_BASELINE = os.path.join(
+    settings.BASE_DIR, 'benchmarks', 'views.json'
+)
+DUMMY_CACHES = {
+    alias: {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+    for alias in settings.CACHES
+}
+LOCMEM_CACHES = {
+    alias: {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': f'benchmark-{alias}',
+    }
+    for alias in settings.CACHES
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет задержку и число запросов страниц постов через '
+        'тестовый клиент на сгенерированных данных во временной базе '
+        'и сравнивает их с сохранённым эталоном.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=100)
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=1000)
+        parser.add_argument('--comments', type=int, default=3000)
+        parser.add_argument('--follows', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            '--warm-cache', action='store_true',
+            help='Мерить с кешем в памяти, а не без кеша',
+        )
+        parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+        parser.add_argument(
+            '--save-baseline', action='store_true',
+            help='Записать результаты в файл эталона',
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.25,
+            help='Допустимый рост p95 относительно эталона, доля',
+        )
+
+    def handle(self, *args, **options):
+        setup_test_environment(debug=False)
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True
+        )
+        caches = LOCMEM_CACHES if options['warm_cache'] else DUMMY_CACHES
+        try:
+            with override_settings(CACHES=caches):
+                self.seed(options)
+                results = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        self.report(results, options)
+
+    def seed(self, options):
+        """Данные через обычный ORM: сигналы заполняют ленты,
+        счётчики и индексы так же, как на сайте."""
+        rng = random.Random(options['seed'])
+        users = [
+            User.objects.create_user(username=f'bench_{i}')
+            for i in range(options['users'])
+        ]
+        groups = [
+            Group.objects.create(
+                title=f'Группа {i}', slug=f'group-{i}', description='…'
+            )
+            for i in range(5)
+        ]
+        self.reader = users[0]
+        for author in rng.sample(users[1:], min(options['follows'],
+                                                len(users) - 1)):
+            Follow.objects.create(user=self.reader, author=author)
+        posts = [
+            Post.objects.create(
+                author=rng.choice(users),
+                group=rng.choice(groups + [None]),
+                text=f'Пост {i} #тег{i % 20} ' + 'текст ' * rng.randint(5, 80),
+            )
+            for i in range(options['posts'])
+        ]
+        # Комментарии сосредоточены на немногих постах, как в жизни.
+        for i in range(options['comments']):
+            Comment.objects.create(
+                post=posts[int(len(posts) ** rng.random()) - 1],
+                author=rng.choice(users),
+                text=f'Комментарий {i}',
+            )
+        self.group = groups[0]
+        self.author = Follow.objects.filter(user=self.reader).first().author
+        self.post = posts[0]
+
+    def scenarios(self):
+        """view: (логин ли, метод, адрес, данные)."""
+        return {
+            'index': (False, 'get', reverse('posts:index'), None),
+            'group_posts': (
+                False, 'get',
+                reverse('posts:group_list', args=[self.group.slug]), None,
+            ),
+            'profile': (
+                False, 'get',
+                reverse('posts:profile', args=[self.author.username]), None,
+            ),
+            'post_detail': (
+                False, 'get',
+                reverse('posts:post_detail', args=[self.post.pk]), None,
+            ),
+            'follow_index': (
+                True, 'get', reverse('posts:follow_index'), None,
+            ),
+            'add_comment': (
+                True, 'post',
+                reverse('posts:add_comment', args=[self.post.pk]),
+                {'text': 'Комментарий из бенчмарка'},
+            ),
+        }
+
+    def run(self, options):
+        guest = Client()
+        reader = Client()
+        reader.force_login(self.reader)
+        results = {}
+        for view, (login, method, url, data) in self.scenarios().items():
+            client = reader if login else guest
+            request = getattr(client, method)
+            for _ in range(options['warmup']):
+                request(url, data)
+            timings = []
+            queries = []
+            for _ in range(options['iterations']):
+                with CaptureQueriesContext(connection) as context:
+                    started = time.perf_counter()
+                    response = request(url, data)
+                    timings.append(time.perf_counter() - started)
+                if response.status_code >= 400:
+                    raise CommandError(
+                        f'{view}: ответ {response.status_code} на {url}'
+                    )
+                queries.append(len(context))
+            results[view] = {
+                **{
+                    f'p{percent}': percentile(timings, percent) * 1000
+                    for percent in PERCENTILES
+                },
+                'queries': max(queries),
+            }
+        return results
+
+    def report(self, results, options):
+        baseline = {}
+        if os.path.exists(options['baseline']):
+            with open(options['baseline']) as file:
+                baseline = json.load(file)
+        self.stdout.write('view\tp50 мс\tp95 мс\tp99 мс\tзапросов\tэталон')
+        regressions = []
+        for view, result in results.items():
+            expected = baseline.get(view)
+            note = '—'
+            if expected:
+                limit = expected['p95'] * (1 + options['tolerance'])
+                note = (
+                    f'p95 {expected["p95"]:.1f} мс, '
+                    f'{expected["queries"]} запросов'
+                )
+                if result['queries'] > expected['queries']:
+                    regressions.append(
+                        f'{view}: запросов {result["queries"]} вместо '
+                        f'{expected["queries"]}'
+                    )
+                if result['p95'] > limit:
+                    regressions.append(
+                        f'{view}: p95 {result["p95"]:.1f} мс, '
+                        f'допустимо {limit:.1f} мс'
+                    )
+            self.stdout.write(
+                f'{view}\t{result["p50"]:.1f}\t{result["p95"]:.1f}'
+                f'\t{result["p99"]:.1f}\t{result["queries"]}\t{note}'
+            )
+        if options['save_baseline']:
+            os.makedirs(os.path.dirname(options['baseline']), exist_ok=True)
+            with open(options['baseline'], 'w') as file:
+                json.dump(results, file, indent=2, sort_keys=True)
+            self.stdout.write(f'Эталон записан в {options["baseline"]}')
+        elif regressions:
+            raise CommandError(
+                'Хуже эталона:\n' + '\n'.join(regressions)
+            )
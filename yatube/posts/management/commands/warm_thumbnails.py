@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+from sorl.thumbnail.models import KVStore as DatabaseKVStore
+
+from core.cache.pages import bump_version
+from posts.models import Post
+from posts.signals import POSTS_VERSION
+from posts.thumbnails import build_thumbnails, ready_thumbnail
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогревает хранилище ключей sorl-thumbnail: строит недостающие '
+        'превью картинок постов и загружает индекс в кеш.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--from-db', action='store_true',
+            help='Сначала перенести ключи из таблицы thumbnail_kvstore.',
+        )
+
+    def handle(self, *args, **options):
+        kvstore = default.kvstore
+        if options['from_db']:
+            rows = DatabaseKVStore.objects.values_list('key', 'value')
+            kvstore.import_rows(rows.iterator())
+        built = 0
+        posts = Post.objects.exclude(image='').values_list('id', 'image')
+        for post_id, name in posts.iterator():
+            if any(
+                ready_thumbnail(name, size) is None
+                for size in settings.POST_THUMBNAIL_SIZES
+            ):
+                build_thumbnails(post_id, name, bump_posts=False)
+                built += 1
+        if built:
+            bump_version(POSTS_VERSION)
+        warmed = kvstore.warm()
+        self.stdout.write(
+            f'Построены превью для постов: {built}, '
+            f'загружено ключей в кеш: {warmed}'
+        )
@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.db import migrations
+
+CREATE_SQL = (
+    'CREATE VIRTUAL TABLE posts_post_search USING fts5('
+    "text, username, group_title, tokenize = 'unicode61 remove_diacritics 2')"
+)
+FILL_SQL = (
+    'INSERT INTO posts_post_search (rowid, text, username, group_title)'
+    " SELECT post.id, post.text, author.username, COALESCE(grp.title, '')"
+    ' FROM posts_post post'
+    ' JOIN {users} author ON author.id = post.author_id'
+    ' LEFT JOIN posts_group grp ON grp.id = post.group_id'
+)
+
+
+def create_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    schema_editor.execute(CREATE_SQL)
+    schema_editor.execute(FILL_SQL.format(users=User._meta.db_table))
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS posts_post_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0023_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 2.2.16 on 2026-10-17 17:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from posts.tags import extract_tags
+
+
+def fill_tags(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Tag = apps.get_model('posts', 'Tag')
+    PostTag = apps.get_model('posts', 'PostTag')
+    post_tags = {}
+    for pk, text in Post.objects.values_list('pk', 'text').iterator():
+        tags = extract_tags(text)
+        if tags:
+            post_tags[pk] = tags
+    slugs = set().union(*post_tags.values())
+    Tag.objects.bulk_create(
+        [Tag(slug=slug) for slug in slugs], batch_size=500
+    )
+    tag_ids = dict(Tag.objects.values_list('slug', 'pk'))
+    PostTag.objects.bulk_create(
+        [
+            PostTag(post_id=pk, tag_id=tag_ids[slug])
+            for pk, tags in post_tags.items() for slug in tags
+        ],
+        batch_size=500,
+    )
+    Tag.objects.update(posts_count=Coalesce(Subquery(
+        PostTag.objects.filter(tag=OuterRef('pk')).order_by().values(
+            'tag'
+        ).annotate(total=Count('pk')).values('total')
+    ), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0024_post_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostTag',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tag_links', to='posts.Post', verbose_name='пост')),
+            ],
+            options={
+                'verbose_name': 'Тег поста',
+                'verbose_name_plural': 'Теги постов',
+            },
+        ),
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slug', models.SlugField(allow_unicode=True, max_length=100, unique=True, verbose_name='тег')),
+                ('posts_count', models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='число постов')),
+                ('posts', models.ManyToManyField(related_name='tags', through='posts.PostTag', to='posts.Post', verbose_name='посты')),
+            ],
+            options={
+                'verbose_name': 'Тег',
+                'verbose_name_plural': 'Теги',
+            },
+        ),
+        migrations.AddField(
+            model_name='posttag',
+            name='tag',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='post_links', to='posts.Tag', verbose_name='тег'),
+        ),
+        migrations.AddConstraint(
+            model_name='posttag',
+            constraint=models.UniqueConstraint(fields=('tag', 'post'), name='unique_post_tag'),
+        ),
+        migrations.RunPython(fill_tags, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 2.2.16 on 2026-10-17 17:45
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_tag_dates(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    PostTag = apps.get_model('posts', 'PostTag')
+    PostTag.objects.update(pub_date=Subquery(
+        Post.objects.filter(pk=OuterRef('post')).values('pub_date')
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0026_comment_post_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='posttag',
+            name='pub_date',
+            field=models.DateTimeField(null=True, verbose_name='дата публикации поста'),
+        ),
+        migrations.RunPython(fill_tag_dates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='posttag',
+            name='pub_date',
+            field=models.DateTimeField(verbose_name='дата публикации поста'),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['user', 'author'], name='follow_user_author_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-pub_date', '-id'], name='post_author_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', '-pub_date', '-id'], name='post_group_date_idx'),
+        ),
+        migrations.AlterField(
+            model_name='tag',
+            name='posts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='число постов'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['-posts_count', 'slug'], name='tag_trending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='posttag',
+            index=models.Index(fields=['tag', '-pub_date', '-post'], name='post_tag_date_idx'),
+        ),
+    ]
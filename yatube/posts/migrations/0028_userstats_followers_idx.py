@@ -0,0 +1,17 @@
+# Generated by Django 2.2.16 on 2026-10-17 18:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0027_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userstats',
+            index=models.Index(fields=['followers_count'], name='userstats_followers_idx'),
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 
+from core.storage import ContentAddressedStorage
+
 User = get_user_model()
 
 
@@ -49,18 +51,120 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True
     )
+    image_width = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='ширина картинки',
+    )
+    image_height = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='высота картинки',
+    )
+    image_placeholder = models.TextField(
+        blank=True,
+        editable=False,
+        verbose_name='заглушка картинки',
+        help_text='Крошечная копия картинки в data URI',
+    )
+    comments_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='число комментариев',
+    )
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        # Ленту по (pub_date, id) читает и индекс одного pub_date:
+        # id — это rowid, который замыкает каждый индекс SQLite.
+        indexes = [
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_date_idx',
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_date_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
 
+class Tag(models.Model):
+    slug = models.SlugField(
+        max_length=100,
+        unique=True,
+        allow_unicode=True,
+        verbose_name='тег',
+    )
+    posts = models.ManyToManyField(
+        Post,
+        through='PostTag',
+        related_name='tags',
+        verbose_name='посты',
+    )
+    posts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='число постов',
+    )
+
+    class Meta:
+        verbose_name = 'Тег'
+        verbose_name_plural = 'Теги'
+        indexes = [
+            models.Index(
+                fields=['-posts_count', 'slug'], name='tag_trending_idx',
+            )
+        ]
+
+    def __str__(self):
+        return f'#{self.slug}'
+
+
+class PostTag(models.Model):
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='tag_links',
+        verbose_name='пост',
+    )
+    tag = models.ForeignKey(
+        Tag,
+        on_delete=models.CASCADE,
+        related_name='post_links',
+        verbose_name='тег',
+    )
+    pub_date = models.DateTimeField(verbose_name='дата публикации поста')
+
+    class Meta:
+        verbose_name = 'Тег поста'
+        verbose_name_plural = 'Теги постов'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['tag', 'post'], name='unique_post_tag'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['tag', '-pub_date', '-post'],
+                name='post_tag_date_idx',
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.post_id}: {self.tag_id}'
+
+
 class Comment(models.Model):
     post = models.ForeignKey(
         Post,
@@ -88,6 +192,12 @@ class Comment(models.Model):
     class Meta:
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
+        indexes = [
+            models.Index(
+                fields=['post', 'created', 'id'],
+                name='comment_post_created_idx',
+            )
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -119,9 +229,80 @@ class Follow(models.Model):
                 fields=['author', 'user'], name='unique_name_description'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['user', 'author'], name='follow_user_author_idx',
+            )
+        ]
 
     def __str__(self):
         text = 'Пользователь {follower_name} подписан на автора {author_name}'
         return text.format(
             follower_name=self.user.username, author_name=self.author.username
         )
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='пользователь',
+    )
+    posts_count = models.PositiveIntegerField(
+        default=0, verbose_name='число постов'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0, verbose_name='число подписчиков'
+    )
+    following_count = models.PositiveIntegerField(
+        default=0, verbose_name='число подписок'
+    )
+
+    class Meta:
+        verbose_name = 'Статистика пользователя'
+        verbose_name_plural = 'Статистика пользователей'
+        # По этому индексу запросы находят авторов-знаменитостей ленты.
+        indexes = [
+            models.Index(
+                fields=['followers_count'], name='userstats_followers_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return str(self.user_id)
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='читатель',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='пост',
+    )
+    pub_date = models.DateTimeField(verbose_name='дата публикации поста')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_feed_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='feed_entry_user_date_idx',
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user_id}: {self.post_id}'
@@ -0,0 +1,105 @@
+"""Полнотекстовый поиск по постам на SQLite FTS5.
+
+Виртуальная таблица posts_post_search хранит для каждого поста
+(rowid = id поста) его текст, имя автора и название группы. Таблицу
+создаёт миграция, а в актуальном состоянии держат сигналы из
+posts.signals. На других СУБД индекса нет, и поиск идёт через
+icontains по тексту.
+"""
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import Group, Post, User
+
+SEARCH_TABLE = 'posts_post_search'
+# Веса столбцов text, username, group_title для bm25: совпадение
+# в имени автора или названии группы важнее совпадения в тексте.
+SEARCH_WEIGHTS = (1.0, 5.0, 3.0)
+
+INDEX_SQL = (
+    f'INSERT OR REPLACE INTO {SEARCH_TABLE}'
+    ' (rowid, text, username, group_title)'
+    ' SELECT post.id, post.text, author.username, COALESCE(grp.title, \'\')'
+    f' FROM {Post._meta.db_table} post'
+    f' JOIN {User._meta.db_table} author ON author.id = post.author_id'
+    f' LEFT JOIN {Group._meta.db_table} grp ON grp.id = post.group_id'
+)
+
+
+def available():
+    return connection.vendor == 'sqlite'
+
+
+def match_query(query):
+    """Безопасное выражение MATCH из пользовательского запроса.
+
+    Каждое слово ищется как префикс, слова объединяются через AND;
+    синтаксис FTS5 из запроса не пропускается. None, если слов нет.
+    """
+    words = re.findall(r'\w+', query.lower())
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def _execute(sql, params=()):
+    if available():
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+
+def index_posts(post_ids):
+    post_ids = list(post_ids)
+    if post_ids:
+        placeholders = ', '.join(['%s'] * len(post_ids))
+        _execute(f'{INDEX_SQL} WHERE post.id IN ({placeholders})', post_ids)
+
+
+def index_author(author_id):
+    _execute(f'{INDEX_SQL} WHERE post.author_id = %s', [author_id])
+
+
+def index_group(group_id):
+    _execute(f'{INDEX_SQL} WHERE post.group_id = %s', [group_id])
+
+
+def remove_post(post_id):
+    _execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [post_id])
+
+
+def rebuild():
+    """Заново заполняет индекс по всем постам; возвращает их число."""
+    _execute(f'DELETE FROM {SEARCH_TABLE}')
+    _execute(INDEX_SQL)
+    return Post.objects.count()
+
+
+def matching_ids(query):
+    """Подзапрос id постов, подходящих под запрос, для filter(id__in=)."""
+    return RawSQL(
+        f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s',
+        [match_query(query)],
+    )
+
+
+def search_posts(query):
+    """Посты по запросу, самые релевантные первыми."""
+    posts = Post.objects.select_related('author', 'group')
+    match = match_query(query)
+    if match is None:
+        return posts.none()
+    if not available():
+        return posts.filter(text__icontains=query).order_by('-pub_date')
+    weights = ', '.join(map(str, SEARCH_WEIGHTS))
+    return posts.extra(
+        tables=[SEARCH_TABLE],
+        where=[
+            f'{SEARCH_TABLE}.rowid = {Post._meta.db_table}.id',
+            f'{SEARCH_TABLE} MATCH %s',
+        ],
+        params=[match],
+        select={'search_rank': f'bm25({SEARCH_TABLE}, {weights})'},
+        order_by=['search_rank', '-pub_date', '-id'],
+    )
@@ -0,0 +1,101 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from core.cache.pages import bump_version
+
+from . import feed, search, stats, tags, thumbnails
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+POSTS_VERSION = 'posts'
+FOLLOWS_VERSION = 'follows'
+COMMENTS_VERSION = 'comments'
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+    elif update_fields is None or set(update_fields) != {'last_login'}:
+        search.index_author(instance.pk)
+        bump_version(POSTS_VERSION)
+        bump_version(f'user:{instance.pk}')
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, **kwargs):
+    bump_version(POSTS_VERSION)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, signal, **kwargs):
+    if signal is post_save:
+        search.index_group(instance.pk)
+    else:
+        search.index_posts(getattr(instance, '_search_post_ids', ()))
+    bump_version(POSTS_VERSION)
+    bump_version(f'group:{instance.pk}')
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleting(sender, instance, **kwargs):
+    # После удаления group_id у постов уже обнулён: запоминаем их,
+    # чтобы убрать название группы из поискового индекса.
+    instance._search_post_ids = list(
+        instance.posts.values_list('id', flat=True)
+    )
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    if created:
+        stats.change_user_stats(instance.author_id, 'posts_count', 1)
+        feed.fan_out_post(instance)
+    thumbnails.schedule_thumbnails(instance)
+    search.index_posts([instance.pk])
+    tags.sync_post_tags(instance)
+    bump_version(POSTS_VERSION)
+    bump_version(f'post:{instance.pk}')
+
+
+@receiver(pre_delete, sender=Post)
+def post_deleting(sender, instance, **kwargs):
+    tags.remove_post_tags(instance)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    stats.change_user_stats(instance.author_id, 'posts_count', -1)
+    search.remove_post(instance.pk)
+    bump_version(POSTS_VERSION)
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, **kwargs):
+    if created and instance.post_id:
+        stats.change_comments_count(instance.post_id, 1)
+    bump_version(COMMENTS_VERSION)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    if instance.post_id:
+        stats.change_comments_count(instance.post_id, -1)
+    bump_version(COMMENTS_VERSION)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        stats.change_user_stats(instance.author_id, 'followers_count', 1)
+        stats.change_user_stats(instance.user_id, 'following_count', 1)
+        feed.backfill_feed(instance.user_id, instance.author_id)
+    bump_version(FOLLOWS_VERSION)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    stats.change_user_stats(instance.author_id, 'followers_count', -1)
+    stats.change_user_stats(instance.user_id, 'following_count', -1)
+    feed.trim_feed(instance.user_id, instance.author_id)
+    bump_version(FOLLOWS_VERSION)
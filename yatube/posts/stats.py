@@ -0,0 +1,74 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Post, User, UserStats
+
+
+def change_user_stats(user_id, field, delta):
+    """Сдвигает счётчик пользователя на delta, не уходя ниже нуля."""
+    stats = UserStats.objects.filter(user_id=user_id)
+    if delta < 0:
+        stats = stats.filter(**{f'{field}__gte': -delta})
+    stats.update(**{field: F(field) + delta})
+
+
+def change_comments_count(post_id, delta):
+    posts = Post.objects.filter(pk=post_id)
+    if delta < 0:
+        posts = posts.filter(comments_count__gte=-delta)
+    posts.update(comments_count=F('comments_count') + delta)
+
+
+def _count(queryset, field):
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+            field
+        ).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def recount_user(user):
+    """Пересчитывает счётчики одного пользователя и возвращает их."""
+    stats, _ = UserStats.objects.update_or_create(
+        user=user,
+        defaults={
+            'posts_count': Post.objects.filter(author=user).count(),
+            'followers_count': Follow.objects.filter(author=user).count(),
+            'following_count': Follow.objects.filter(user=user).count(),
+        },
+    )
+    return stats
+
+
+def stats_for(user):
+    """Счётчики пользователя; при отсутствии записи она создаётся."""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        return recount_user(user)
+
+
+def recount_all():
+    """Пересчитывает все счётчики по исходным таблицам.
+
+    Возвращает число обновлённых пользователей и постов.
+    """
+    UserStats.objects.bulk_create(
+        (
+            UserStats(user_id=user_id)
+            for user_id in User.objects.filter(
+                stats__isnull=True
+            ).values_list('id', flat=True).iterator()
+        ),
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    users = UserStats.objects.update(
+        posts_count=_count(Post.objects.all(), 'author'),
+        followers_count=_count(Follow.objects.all(), 'author'),
+        following_count=_count(Follow.objects.all(), 'user'),
+    )
+    posts = Post.objects.update(
+        comments_count=_count(Comment.objects.all(), 'post')
+    )
+    return users, posts
@@ -0,0 +1,124 @@
+"""Хештеги постов.
+
+Теги вынимаются из текста при сохранении поста и пишутся в таблицу
+связей PostTag, поэтому страница тега читает посты по индексу, а не
+перебирает тексты через icontains. У тега есть счётчик постов, а
+список популярных тегов лежит в кеше и правится на месте при каждом
+изменении счётчиков, без пересчёта по всей таблице.
+"""
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+
+from .models import Post, PostTag, Tag
+
+HASHTAG = re.compile(r'(?<![\w&#])#(\w*[^\W\d_]\w*)')
+TRENDING_CACHE_KEY = 'tags:trending'
+TAG_MAX_LENGTH = Tag._meta.get_field('slug').max_length
+# Как и в ленте, посты с одинаковой датой идут по post_id связи.
+TAG_TIEBREAK = 'tag_post'
+
+
+def extract_tags(text):
+    """Множество тегов из текста: без решётки, в нижнем регистре."""
+    return {
+        tag.lower() for tag in HASHTAG.findall(text)
+        if len(tag) <= TAG_MAX_LENGTH
+    }
+
+
+def sync_post_tags(post):
+    """Приводит связи поста с тегами в соответствие с его текстом."""
+    wanted = extract_tags(post.text)
+    current = dict(
+        PostTag.objects.filter(post=post).values_list('tag__slug', 'tag_id')
+    )
+    removed = [current[slug] for slug in current.keys() - wanted]
+    added = wanted - current.keys()
+    if removed:
+        PostTag.objects.filter(post=post, tag_id__in=removed).delete()
+        _change_counts(removed, -1)
+    if added:
+        Tag.objects.bulk_create(
+            [Tag(slug=slug) for slug in added], ignore_conflicts=True
+        )
+        added = list(
+            Tag.objects.filter(slug__in=added).values_list('id', flat=True)
+        )
+        PostTag.objects.bulk_create(
+            [
+                PostTag(post=post, tag_id=tag_id, pub_date=post.pub_date)
+                for tag_id in added
+            ],
+            ignore_conflicts=True,
+        )
+        _change_counts(added, 1)
+
+
+def tagged_posts(tag):
+    """Посты с тегом; сортировка идёт по индексу связей."""
+    return Post.objects.select_related('author', 'group').filter(
+        tag_links__tag=tag
+    ).annotate(
+        tag_date=F('tag_links__pub_date'),
+        tag_post=F('tag_links__post'),
+    )
+
+
+def remove_post_tags(post):
+    """Убирает связи удаляемого поста и уменьшает счётчики его тегов."""
+    links = PostTag.objects.filter(post=post)
+    tag_ids = list(links.values_list('tag_id', flat=True))
+    if tag_ids:
+        links.delete()
+        _change_counts(tag_ids, -1)
+
+
+def _change_counts(tag_ids, delta):
+    tags = Tag.objects.filter(pk__in=tag_ids)
+    if delta < 0:
+        tags = tags.filter(posts_count__gte=-delta)
+    tags.update(posts_count=F('posts_count') + delta)
+    _update_trending(
+        dict(Tag.objects.filter(pk__in=tag_ids).values_list(
+            'slug', 'posts_count'
+        )),
+        delta < 0,
+    )
+
+
+def _update_trending(counts, decreased):
+    """Вносит новые счётчики тегов в закешированный список популярных."""
+    trending = cache.get(TRENDING_CACHE_KEY)
+    if trending is None:
+        return
+    limit = settings.TRENDING_TAGS_LIMIT
+    top = dict(trending)
+    if decreased and len(top) >= limit and counts.keys() & top.keys():
+        # Тег из полного списка мог опуститься ниже тех, которых в
+        # списке нет: такой список проще один раз собрать заново.
+        cache.delete(TRENDING_CACHE_KEY)
+        return
+    top.update(counts)
+    trending = sorted(
+        ((slug, count) for slug, count in top.items() if count),
+        key=lambda item: (-item[1], item[0]),
+    )[:limit]
+    cache.set(TRENDING_CACHE_KEY, trending, settings.TRENDING_TAGS_TIMEOUT)
+
+
+def trending_tags():
+    """Самые частые теги списком пар (тег, число постов)."""
+    return cache.get_or_set(
+        TRENDING_CACHE_KEY,
+        lambda: list(
+            Tag.objects.filter(posts_count__gt=0).order_by(
+                '-posts_count', 'slug'
+            ).values_list('slug', 'posts_count')[
+                :settings.TRENDING_TAGS_LIMIT
+            ]
+        ),
+        settings.TRENDING_TAGS_TIMEOUT,
+    )
@@ -0,0 +1,89 @@
+from django import template
+from django.conf import settings
+from django.core.cache import caches
+from django.template.defaultfilters import linebreaksbr
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+from core.cache.pages import get_versions
+from posts.tags import HASHTAG, TAG_MAX_LENGTH, trending_tags
+from posts.thumbnails import (display_size, ready_thumbnail,
+                              schedule_thumbnails)
+
+register = template.Library()
+
+CARD_KEY = 'post-card:{post}:{versions}:{flags}'
+
+
+def post_versions(post):
+    """Имена версий, от которых зависит карточка поста."""
+    names = [f'post:{post.pk}', f'user:{post.author_id}']
+    if post.group_id:
+        names.append(f'group:{post.group_id}')
+    return names
+
+
+@register.simple_tag
+def post_card(post, is_author=False, is_music=False):
+    """Картинка и карточка поста, закешированные по версиям поста,
+    автора и группы: одна и та же карточка на всех страницах
+    рендерится один раз."""
+    cache = caches[settings.PAGE_CACHE_ALIAS]
+    key = CARD_KEY.format(
+        post=post.pk,
+        versions='.'.join(map(str, get_versions(post_versions(post)))),
+        flags=f'{int(bool(is_author))}{int(bool(is_music))}',
+    )
+    html = cache.get(key)
+    if html is None:
+        html = render_to_string('includes/post_article.html', {
+            'post': post,
+            'is_author': is_author,
+            'is_music': is_music,
+        })
+        cache.set(key, html, settings.FRAGMENT_CACHE_TIMEOUT)
+    return mark_safe(html)
+
+
+@register.inclusion_tag('includes/post_image.html')
+def post_picture(post, size='card'):
+    """Картинка поста со srcset во всех ширинах и форматах размера size.
+
+    Картинку здесь никогда не пережимают: если превью ещё нет,
+    его построение ставится в очередь, а шаблон показывает заглушку.
+    """
+    if size not in settings.POST_THUMBNAIL_SIZES:
+        raise template.TemplateSyntaxError(
+            f'Размер превью {size} не указан в POST_THUMBNAIL_SIZES'
+        )
+    thumbnail = None
+    if post.image:
+        thumbnail = ready_thumbnail(post.image.name, size)
+        if thumbnail is None:
+            schedule_thumbnails(post)
+    width, height = display_size(post, settings.POST_THUMBNAIL_SIZES[size])
+    return {'post': post, 'im': thumbnail, 'width': width, 'height': height}
+
+
+@register.filter
+def hashtags(text):
+    """Текст поста с переносами строк и ссылками на страницы тегов."""
+    def link(match):
+        tag = match.group(1)
+        if len(tag) > TAG_MAX_LENGTH:
+            return match.group(0)
+        return format_html(
+            '<a href="{}">#{}</a>',
+            reverse('posts:tag_posts', args=[tag.lower()]),
+            tag,
+        )
+    # Теги ищутся в уже экранированном тексте: сущности вроде &#x27;
+    # шаблон тега не захватывает.
+    return mark_safe(HASHTAG.sub(link, linebreaksbr(text)))
+
+
+@register.inclusion_tag('includes/trending_tags.html')
+def trending():
+    return {'tags': trending_tags()}
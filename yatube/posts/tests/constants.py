@@ -1,9 +1,13 @@
+import hashlib
+
 INDEX_URL = 'posts:index'
 GROUP_URL = 'posts:group_list'
 PROFILE_URL = 'posts:profile'
 POST_DETAIL_URL = 'posts:post_detail'
 POST_CREATE_URL = 'posts:post_create'
 POST_EDIT_URL = 'posts:post_edit'
+SEARCH_URL = 'posts:search'
+TAG_URL = 'posts:tag_posts'
 
 INDEX_TEMPLATE = 'posts/index.html'
 GROUP_TEMPLATE = 'posts/group_list.html'
@@ -11,6 +15,8 @@ PROFILE_TEMPLATE = 'posts/profile.html'
 POST_DETAIL_TEMPLATE = 'posts/post_detail.html'
 POST_CREATE_TEMPLATE = 'posts/create_post.html'
 POST_EDIT_TEMPLATE = 'posts/create_post.html'
+SEARCH_TEMPLATE = 'posts/search.html'
+TAG_TEMPLATE = 'posts/tag_list.html'
 
 AUTHOR_NAME = 'author'
 USER_NAME = 'user'
@@ -31,3 +37,8 @@ SMALL_GIF = (
     b'\x02\x00\x01\x00\x00\x02\x02\x0C'
     b'\x0A\x00\x3B'
 )
+# Картинки хранятся под sha256 содержимого в двух уровнях каталогов.
+IMAGE_HASH = hashlib.sha256(SMALL_GIF).hexdigest()
+IMAGE_PATH = (
+    f'{IMAGE_FOLDER}{IMAGE_HASH[:2]}/{IMAGE_HASH[2:4]}/{IMAGE_HASH}.gif'
+)
@@ -2,15 +2,25 @@ import shutil
 import tempfile
 
 from http import HTTPStatus
+from io import BytesIO, StringIO
 
 from django.conf import settings
+from django.contrib import admin
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.forms import modelform_factory
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 
+from core.cache.pages import get_version
+from posts.admin import PostAdmin
 from posts.forms import PostForm
 from posts.models import Comment, Group, Post, User
 from posts.tests import constants as cs
+from posts.thumbnails import process_image
 
 POST_TEXT_OLD = 'First check'
 POST_TEXT_NEW = 'Second check'
@@ -81,7 +91,119 @@ class PostFormTests(TestCase):
         self.assertEqual(first_object.text, POST_TEXT_OLD)
         self.assertEqual(first_object.group, self.group)
         self.assertEqual(first_object.author, self.author)
-        self.assertEqual(first_object.image, cs.IMAGE_FOLDER + cs.IMAGE_NAME)
+        self.assertEqual(first_object.image, cs.IMAGE_PATH)
+        self.assertEqual(
+            (first_object.image_width, first_object.image_height), (2, 1)
+        )
+        self.assertEqual(first_object.image_placeholder, '')
+
+    @override_settings(POST_IMAGE_MAX_UPLOAD_SIZE=10)
+    def test_upload_size_limit(self):
+        """Слишком большой файл отбрасывается при загрузке."""
+        self.assert_upload_rejected()
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=1)
+    def test_upload_pixels_limit(self):
+        """Картинка с лишними пикселями отбрасывается по заголовку."""
+        self.assert_upload_rejected()
+
+    @override_settings(POST_IMAGE_MAX_UPLOAD_SIZE=10)
+    def test_edit_upload_size_limit(self):
+        """Отброшенная при правке картинка показывается ошибкой формы,
+        пост не меняется."""
+        response = self.author_client.post(
+            reverse(cs.POST_EDIT_URL, kwargs={'post_id': self.post.id}),
+            data=self.upload_data(),
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertIn('поменьше', response.context['form'].errors['image'][0])
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.text, cs.POST_TEXT)
+        self.assertFalse(self.post.image)
+
+    def upload_data(self):
+        return {
+            'text': POST_TEXT_OLD,
+            'image': SimpleUploadedFile(
+                name=cs.IMAGE_NAME,
+                content=cs.SMALL_GIF,
+                content_type='image/gif',
+            ),
+        }
+
+    def assert_upload_rejected(self):
+        posts_count = Post.objects.count()
+        response = self.author_client.post(
+            reverse(cs.POST_CREATE_URL), data=self.upload_data(),
+        )
+        self.assertEqual(Post.objects.count(), posts_count)
+        self.assertIn('поменьше', response.context['form'].errors['image'][0])
+
+    @override_settings(POST_IMAGE_MAX_DIMENSION=10)
+    def test_process_image(self):
+        """Воркер уменьшает оригинал, убирает EXIF и строит заглушку."""
+        original = BytesIO()
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'
+        Image.new('RGB', (40, 20), 'red').save(
+            original, 'JPEG', exif=exif.tobytes()
+        )
+        post = Post.objects.create(
+            author=self.author,
+            text=POST_TEXT_OLD,
+            image=SimpleUploadedFile(
+                name='big.jpg',
+                content=original.getvalue(),
+                content_type='image/jpeg',
+            ),
+        )
+        old_name = post.image.name
+        process_image(post.id, old_name)
+        post.refresh_from_db()
+        self.assertNotEqual(post.image.name, old_name)
+        self.assertFalse(default_storage.exists(old_name))
+        self.assertEqual((post.image_width, post.image_height), (10, 5))
+        self.assertTrue(post.image_placeholder.startswith('data:image/'))
+        with post.image.open('rb') as file, Image.open(file) as image:
+            self.assertEqual(image.size, (10, 5))
+            self.assertNotIn('exif', image.info)
+
+    def test_fill_image_metadata(self):
+        """Команда заполняет размеры картинок у старых постов."""
+        post = Post.objects.create(
+            author=self.author,
+            text=POST_TEXT_OLD,
+            image=SimpleUploadedFile(
+                name=cs.IMAGE_NAME,
+                content=cs.SMALL_GIF,
+                content_type='image/gif',
+            ),
+        )
+        self.assertIsNone(post.image_width)
+        version = get_version(f'post:{post.pk}')
+        call_command('fill_image_metadata', stdout=StringIO())
+        self.assertNotEqual(get_version(f'post:{post.pk}'), version)
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
+        self.assertNotEqual(post.image_placeholder, '')
+
+    def test_shard_post_images(self):
+        """Команда переносит картинки из плоского каталога."""
+        storage = FileSystemStorage()
+        legacy = storage.save('posts/legacy.gif', ContentFile(cs.SMALL_GIF))
+        first = Post.objects.create(
+            author=self.author, text=POST_TEXT_OLD, image=legacy
+        )
+        second = Post.objects.create(
+            author=self.author, text=POST_TEXT_NEW, image=legacy
+        )
+        call_command('shard_post_images', stdout=StringIO())
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.image.name, cs.IMAGE_PATH)
+        self.assertEqual(second.image.name, cs.IMAGE_PATH)
+        self.assertFalse(storage.exists(legacy))
+        self.assertTrue(storage.exists(cs.IMAGE_PATH))
 
     def test_edit_post(self):
         """Валидная форма редактирует пост в Post."""
@@ -100,6 +222,35 @@ class PostFormTests(TestCase):
         self.assertEqual(update_object.group, self.group)
         self.assertEqual(update_object.author, self.author)
 
+    def test_edit_keeps_concurrent_updates(self):
+        """Правка поста в форме и в админке не затирает счётчик
+        комментариев и картинку, изменённые после загрузки поста."""
+        stale = Post.objects.get(pk=self.post.pk)
+        Post.objects.filter(pk=self.post.pk).update(
+            comments_count=3, image=cs.IMAGE_PATH
+        )
+        form = PostForm({'text': POST_TEXT_NEW}, instance=stale)
+        form.save()
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.text, POST_TEXT_NEW)
+        self.assertEqual(post.comments_count, 3)
+        self.assertEqual(post.image.name, cs.IMAGE_PATH)
+        stale = Post.objects.get(pk=self.post.pk)
+        Post.objects.filter(pk=self.post.pk).update(comments_count=4)
+        post_admin = PostAdmin(Post, admin.site)
+        form_class = modelform_factory(
+            Post, fields=('text', 'author', 'group', 'image')
+        )
+        form = form_class({
+            'text': POST_TEXT_OLD, 'author': self.author.pk,
+        }, instance=stale)
+        self.assertTrue(form.is_valid())
+        post_admin.save_model(None, form.save(commit=False), form, True)
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.text, POST_TEXT_OLD)
+        self.assertEqual(post.comments_count, 4)
+        self.assertEqual(post.image.name, cs.IMAGE_PATH)
+
     def test_make_comment_authorized_client(self):
         '''Комментировать посты может только авторизованный пользователь,
         После успешной отправки комментарий появляется на странице поста'''
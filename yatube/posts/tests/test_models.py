@@ -1,6 +1,11 @@
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.db.models import F
 from django.test import TestCase
 
-from posts.models import Comment, Follow, Group, Post, User
+from posts.models import (Comment, FeedEntry, Follow, Group, Post, Tag,
+                          User, UserStats)
 from posts.tests import constants as cs
 
 
@@ -92,3 +97,110 @@ class PostModelTest(TestCase):
                 self.assertEqual(
                     post._meta.get_field(field).help_text, expected_value
                 )
+
+
+class StatsCountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username=cs.AUTHOR_NAME)
+        cls.user = User.objects.create_user(username=cs.USER_NAME)
+
+    def test_counters_follow_signals(self):
+        """Счётчики меняются при создании и удалении объектов."""
+        post = Post.objects.create(author=self.author, text=cs.POST_TEXT)
+        comment = Comment.objects.create(
+            author=self.user, post=post, text=cs.POST_COMMENT
+        )
+        follow = Follow.objects.create(author=self.author, user=self.user)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        author_stats = UserStats.objects.get(user=self.author)
+        user_stats = UserStats.objects.get(user=self.user)
+        self.assertEqual(author_stats.posts_count, 1)
+        self.assertEqual(author_stats.followers_count, 1)
+        self.assertEqual(user_stats.following_count, 1)
+
+        comment.delete()
+        follow.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        author_stats.refresh_from_db()
+        self.assertEqual(author_stats.followers_count, 0)
+
+    def test_recount_repairs_drift(self):
+        """Команда recount исправляет разошедшиеся счётчики."""
+        Post.objects.bulk_create([
+            Post(author=self.author, text=cs.POST_TEXT) for _ in range(3)
+        ])
+        UserStats.objects.filter(user=self.user).update(following_count=5)
+        call_command('recount', stdout=StringIO())
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 3
+        )
+        self.assertEqual(
+            UserStats.objects.get(user=self.user).following_count, 0
+        )
+
+
+class SeedScaleTest(TestCase):
+    def seed(self, prefix):
+        call_command(
+            'seed_scale', users=30, groups=3, posts=200, comments=300,
+            follows=5, tags=10, seed=7, prefix=prefix, stdout=StringIO(),
+        )
+        return list(
+            Post.objects.filter(author__username__startswith=prefix)
+            .order_by('pk').values_list('text', flat=True)
+        )
+
+    def test_seed_is_deterministic_and_consistent(self):
+        """Одинаковый seed даёт одни и те же данные со своими счётчиками,
+        лентами и тегами."""
+        first = self.seed('one_')
+        self.assertEqual(len(first), 200)
+        self.assertEqual(first, self.seed('two_'))
+        self.assertEqual(
+            Comment.objects.filter(author__username__startswith='one_')
+            .count(), 300,
+        )
+        author = User.objects.filter(
+            username__startswith='one_'
+        ).order_by('-stats__followers_count').first()
+        self.assertEqual(
+            author.stats.followers_count, author.following.count()
+        )
+        self.assertEqual(
+            author.stats.posts_count, author.posts.count()
+        )
+        follow = Follow.objects.filter(author__posts__isnull=False).first()
+        self.assertTrue(
+            FeedEntry.objects.filter(
+                user=follow.user, post__author=follow.author
+            ).exists()
+        )
+        tag = Tag.objects.get(slug='лес')
+        self.assertEqual(tag.posts_count, tag.posts.count())
+        self.assertGreater(tag.posts_count, 0)
+
+    def test_small_population_follows_everyone(self):
+        """Даже если подписаться нужно на всех остальных, генерация
+        завершается и никто не подписан на себя."""
+        call_command(
+            'seed_scale', users=5, posts=50, comments=10, follows=10,
+            tags=5, groups=2, seed=3, prefix='few_', stdout=StringIO(),
+        )
+        follows = Follow.objects.filter(user__username__startswith='few_')
+        self.assertTrue(follows.exists())
+        self.assertFalse(
+            follows.filter(user=F('author')).exists()
+        )
+        self.assertTrue(
+            follows.filter(author__username='few_4').exists()
+        )
+
+    def test_prefix_must_be_new(self):
+        """Повторный запуск с тем же префиксом не дублирует данные."""
+        User.objects.create_user(username='one_0')
+        with self.assertRaises(CommandError):
+            self.seed('one_')
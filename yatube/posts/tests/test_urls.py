@@ -38,6 +38,7 @@ class PostsURLTests(TestCase):
              cs.PROFILE_TEMPLATE, HTTPStatus.OK),
             (cs.POST_DETAIL_URL, {'post_id': cls.post.id},
              cs.POST_DETAIL_TEMPLATE, HTTPStatus.OK),
+            (cs.SEARCH_URL, None, cs.SEARCH_TEMPLATE, HTTPStatus.OK),
         )
 
         cls.private_urls = (
@@ -1,18 +1,39 @@
 from http import HTTPStatus
+from io import StringIO
 
 import shutil
 import tempfile
+from unittest import mock
 
 from django.conf import settings
+from django.contrib import admin
+from django.contrib.sessions.models import Session
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.paginator import Page
 from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.template import Context, Template
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-
-from posts.models import Group, Post, User, Follow
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.base import ThumbnailBackend
+
+from core.cache.pages import page_cache_stats, reset_page_cache_stats
+from posts.admin import PostAdmin
+from posts.feed import (CELEBRITIES_CACHE_KEY, CELEBRITIES_LOCK_KEY,
+                        refresh_celebrities)
+from posts.management.commands.check_query_plans import (
+    Command as CheckQueryPlans)
+from posts.models import (Comment, FeedEntry, Follow, Group, Post, PostTag,
+                          Tag, User)
+from posts.signals import POSTS_VERSION
 from posts.tests import constants as cs
 from posts.forms import PostForm
+from posts.tags import trending_tags
+from posts.thumbnails import build_thumbnails, ready_thumbnail
+from posts.utils import CursorPage
 
 POSTS_PER_PAGE = 10
 POSTS_SECOND_PAGE = 1
@@ -49,6 +70,8 @@ class PostPagesTests(TestCase):
                 content=cs.SMALL_GIF,
                 content_type='image/gif',
             ),
+            image_width=2,
+            image_height=1,
         )
         cls.form = PostForm()
 
@@ -58,6 +81,7 @@ class PostPagesTests(TestCase):
         shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
 
     def setUp(self):
+        cache.clear()
         self.author_client = Client()
         self.author_client.force_login(self.author)
         self.authorized_client = Client()
@@ -129,17 +153,28 @@ class PostPagesTests(TestCase):
         self.assertEqual(response.context['group'], self.group)
 
     def test_check_work_cache(self):
-        """Проверка работы кэша на главной странице."""
+        """Главная страница берётся из кеша, пока не изменятся посты."""
         response_1 = self.guest_client.get(reverse(cs.INDEX_URL))
+        Post.objects.filter(pk=self.post.pk).update(text=POST_TEXT_NEW)
+        response_2 = self.guest_client.get(reverse(cs.INDEX_URL))
+        self.assertEqual(response_1.content, response_2.content)
         Post.objects.create(
             author=self.author,
-            text='Test post',
+            text=POST_TEXT_OLD,
         )
-        response_2 = self.guest_client.get(reverse(cs.INDEX_URL))
-        self.assertEqual(response_1.content, response_2.content)
-        cache.clear()
         response_3 = self.guest_client.get(reverse(cs.INDEX_URL))
         self.assertNotEqual(response_1.content, response_3.content)
+        self.assertContains(response_3, POST_TEXT_OLD)
+
+    def test_index_cache_invalidated_by_group_change(self):
+        """Изменение группы сбрасывает кеш главной страницы."""
+        response_1 = self.guest_client.get(reverse(cs.INDEX_URL))
+        group = Group.objects.get(pk=self.group.pk)
+        group.title = POST_TEXT_NEW
+        group.save()
+        response_2 = self.guest_client.get(reverse(cs.INDEX_URL))
+        self.assertNotEqual(response_1.content, response_2.content)
+        self.assertContains(response_2, POST_TEXT_NEW)
 
     def test_create_picture_post(self):
         """Проверка, что картинка существует на страницах."""
@@ -147,29 +182,102 @@ class PostPagesTests(TestCase):
             reverse(cs.POST_CREATE_URL)
         )
         post = Post.objects.get(pk=self.post.id)
-        self.assertEqual(post.image, cs.IMAGE_FOLDER + cs.IMAGE_NAME)
+        self.assertEqual(post.image, cs.IMAGE_PATH)
         cache.clear()
         response_1 = self.author_client.get(reverse(cs.INDEX_URL))
         first_object = response_1.context['page_obj'].object_list[0].image
-        self.assertEqual(first_object, cs.IMAGE_FOLDER + cs.IMAGE_NAME)
+        self.assertEqual(first_object, cs.IMAGE_PATH)
 
         response_2 = self.author_client.get(
             reverse(cs.PROFILE_URL, kwargs={'username': self.author})
         )
         second_object = response_2.context['page_obj'].object_list[0].image
-        self.assertEqual(second_object, cs.IMAGE_FOLDER + cs.IMAGE_NAME)
+        self.assertEqual(second_object, cs.IMAGE_PATH)
 
         response_3 = self.author_client.get(
             reverse(cs.GROUP_URL, kwargs={'slug': self.group.slug})
         )
         third_object = response_3.context['page_obj'].object_list[0].image
-        self.assertEqual(third_object, cs.IMAGE_FOLDER + cs.IMAGE_NAME)
+        self.assertEqual(third_object, cs.IMAGE_PATH)
 
         response_4 = self.author_client.get(
             reverse(cs.POST_DETAIL_URL, kwargs={'post_id': self.post.id})
         )
         fourth_object = response_4.context.get('post').image
-        self.assertEqual(fourth_object, cs.IMAGE_FOLDER + cs.IMAGE_NAME)
+        self.assertEqual(fourth_object, cs.IMAGE_PATH)
+
+    def test_thumbnail_placeholder_until_built(self):
+        """Пока превью не построено, вместо картинки выводится заглушка."""
+        url = reverse(cs.POST_DETAIL_URL, kwargs={'post_id': self.post.id})
+        response = self.author_client.get(url)
+        # Заглушка занимает место картинки в её пропорциях.
+        self.assertContains(response, 'card-img my-2 bg-light')
+        self.assertContains(response, 'aspect-ratio: 2 / 1;')
+        self.assertIsNone(ready_thumbnail(self.post.image.name, 'detail'))
+
+        build_thumbnails(self.post.id, self.post.image.name)
+        card = ready_thumbnail(self.post.image.name, 'card')
+        self.assertEqual((card['width'], card['height']), (960, 339))
+        thumbnail = ready_thumbnail(self.post.image.name, 'detail')
+        self.assertEqual((thumbnail['width'], thumbnail['height']), (2, 1))
+        response = self.author_client.get(url)
+        self.assertNotContains(response, 'card-img my-2 bg-light')
+        self.assertContains(response, thumbnail['url'])
+
+    def test_thumbnail_kvstore_without_sql(self):
+        """Известное превью sorl находит в файле-индексе, не обращаясь
+        к основной базе и не строя его заново."""
+        build_thumbnails(self.post.id, self.post.image.name)
+        url = ready_thumbnail(self.post.image.name, 'card')['url']
+        size = settings.POST_THUMBNAIL_SIZES['card']
+        cache.clear()
+        kvstore = default.kvstore
+        with mock.patch.object(
+            kvstore, '_connection', wraps=kvstore._connection
+        ) as index, mock.patch.object(
+            ThumbnailBackend, '_create_thumbnail'
+        ) as create:
+            with self.assertNumQueries(0):
+                thumbnail = get_thumbnail(
+                    self.post.image.name, size['geometry'],
+                    format='JPEG', **size['options']
+                )
+        self.assertTrue(index.called)
+        create.assert_not_called()
+        self.assertEqual(thumbnail.url, url)
+
+    def test_warm_thumbnails(self):
+        """Прогрев строит недостающие превью картинок постов
+        и сбрасывает общую версию постов один раз."""
+        with mock.patch(
+            'posts.management.commands.warm_thumbnails.bump_version'
+        ) as bump:
+            call_command('warm_thumbnails', stdout=StringIO())
+        self.assertIsNotNone(ready_thumbnail(self.post.image.name, 'card'))
+        bump.assert_called_once_with(POSTS_VERSION)
+
+    def test_build_thumbnails_command(self):
+        """Команда строит превью картинок постов и сбрасывает общую
+        версию постов один раз на весь проход."""
+        with mock.patch(
+            'posts.management.commands.build_thumbnails.bump_version'
+        ) as bump, mock.patch('posts.thumbnails.bump_version') as post_bump:
+            call_command('build_thumbnails', workers=0, stdout=StringIO())
+        self.assertIsNotNone(ready_thumbnail(self.post.image.name, 'card'))
+        bump.assert_called_once_with(POSTS_VERSION)
+        self.assertNotIn(
+            mock.call(POSTS_VERSION), post_bump.call_args_list
+        )
+
+    def test_thumbnail_srcset(self):
+        """Превью строится во всех ширинах для srcset."""
+        build_thumbnails(self.post.id, self.post.image.name)
+        thumbnail = ready_thumbnail(self.post.image.name, 'card')
+        self.assertRegex(thumbnail['srcset'], r' 320w, .+ 640w, .+ 960w$')
+        response = self.guest_client.get(reverse(cs.INDEX_URL))
+        self.assertContains(response, f'srcset="{thumbnail["srcset"]}"')
+        for source in thumbnail['sources']:
+            self.assertContains(response, f'type="{source["type"]}"')
 
 
 class PaginatorViewsTest(TestCase):
@@ -190,19 +298,13 @@ class PaginatorViewsTest(TestCase):
         ])
 
     def setUp(self):
+        cache.clear()
         self.author_client = Client()
         self.author_client.force_login(self.user)
 
     def test_paginator(self):
-        '''Проверка работы Пагинатора'''
-        mount_of_posts_on_the_first_page = POSTS_PER_PAGE
-        mount_of_posts_on_the_second_page = POSTS_SECOND_PAGE
-
-        pages = (
-            (1, mount_of_posts_on_the_first_page),
-            (2, mount_of_posts_on_the_second_page),
-        )
-
+        '''Проверка работы Пагинатора: старые номера страниц отдают
+        первую страницу без OFFSET и COUNT(*).'''
         urls_expected_post_number = (
             PAG_INDEX_URL,
             PAG_GROUP_LIST_URL,
@@ -210,14 +312,78 @@ class PaginatorViewsTest(TestCase):
         )
 
         for url in urls_expected_post_number:
-            for page, mount in pages:
+            for page in (1, 2, 300):
                 with self.subTest(url=url, page=page):
-                    response = self.author_client.get(url, {'page': page})
+                    cache.clear()
+                    with CaptureQueriesContext(connection) as queries:
+                        response = self.author_client.get(
+                            url, {'page': page}
+                        )
                     page_obj = response.context.get('page_obj')
                     self.assertEqual(response.status_code, HTTPStatus.OK)
                     self.assertIsNotNone(page_obj)
                     self.assertIsInstance(page_obj, Page)
-                    self.assertEqual(len(page_obj.object_list), mount)
+                    self.assertEqual(
+                        len(page_obj.object_list), POSTS_PER_PAGE
+                    )
+                    self.assertTrue(page_obj.has_next())
+                    sql = ' '.join(query['sql'] for query in queries)
+                    self.assertNotIn('OFFSET', sql)
+                    self.assertNotIn('COUNT(*)', sql)
+
+    def test_cursor_paginator(self):
+        '''Курсорный пагинатор отдаёт те же посты, что и номерной.'''
+        urls = (
+            PAG_INDEX_URL,
+            PAG_GROUP_LIST_URL,
+            PAG_PROFILE_URL,
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                cache.clear()
+                first_page = self.author_client.get(url).context['page_obj']
+                self.assertTrue(first_page.has_next())
+                response = self.author_client.get(
+                    url, {'cursor': first_page.next_cursor}
+                )
+                page_obj = response.context.get('page_obj')
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertIsInstance(page_obj, CursorPage)
+                self.assertEqual(
+                    len(page_obj.object_list), POSTS_SECOND_PAGE
+                )
+                self.assertFalse(page_obj.has_next())
+                self.assertTrue(page_obj.has_previous())
+                response = self.author_client.get(
+                    url, {'cursor': page_obj.previous_cursor}
+                )
+                self.assertEqual(
+                    list(response.context['page_obj'].object_list),
+                    list(first_page.object_list),
+                )
+
+    def test_keyset_navigation_links(self):
+        '''Ссылки страниц ведут только по курсору: без номеров
+        и «Последней», «Первая» — только после перехода.'''
+        response = self.author_client.get(PAG_PROFILE_URL)
+        self.assertContains(response, '?cursor=')
+        self.assertNotContains(response, 'Последняя')
+        self.assertNotContains(response, 'Первая')
+        self.assertNotContains(response, '?page=2')
+        response = self.author_client.get(
+            PAG_PROFILE_URL,
+            {'cursor': response.context['page_obj'].next_cursor},
+        )
+        self.assertContains(response, 'Первая')
+        self.assertNotContains(response, 'Последняя')
+
+    def test_cursor_paginator_broken_cursor(self):
+        '''Битый курсор открывает первую страницу.'''
+        response = self.author_client.get(PAG_PROFILE_URL, {'cursor': '!!'})
+        page_obj = response.context['page_obj']
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(len(page_obj.object_list), POSTS_PER_PAGE)
+        self.assertFalse(page_obj.has_previous())
 
 
 class ProfileFollowTest(TestCase):
@@ -265,3 +431,580 @@ class ProfileFollowTest(TestCase):
         self.assertNotIn(
             cs.POST_TEXT, response_2.context.get('page_obj').object_list
         )
+
+    def test_feed_entries_follow_posts(self):
+        """Записи ленты появляются при подписке и новом посте
+        и удаляются при отписке."""
+        self.authorized_client.get(
+            reverse('posts:profile_follow', kwargs={'username': self.author})
+        )
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.user, post=self.post
+        ).exists())
+        new_post = Post.objects.create(author=self.author, text=POST_TEXT_NEW)
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj'].object_list),
+            [new_post, self.post],
+        )
+        self.authorized_client.get(
+            reverse('posts:profile_unfollow', kwargs={'username': self.author})
+        )
+        self.assertFalse(FeedEntry.objects.filter(user=self.user).exists())
+
+    def test_feed_pages_without_count(self):
+        """Ни первая страница ленты, ни страницы по курсору
+        не считают COUNT(*) по всей ленте."""
+        Follow.objects.create(user=self.user, author=self.author)
+        for i in range(POSTS_PER_PAGE):
+            Post.objects.create(author=self.author, text=f'{cs.POST_TEXT} {i}')
+        params = {}
+        for page in ('первая', 'по курсору'):
+            with self.subTest(page=page):
+                cache.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.authorized_client.get(
+                        reverse('posts:follow_index'), params
+                    )
+                self.assertNotIn(
+                    'COUNT(', ' '.join(query['sql'] for query in queries)
+                )
+            params = {'cursor': response.context['page_obj'].next_cursor}
+
+
+@override_settings(FEED_PULL_THRESHOLD=0)
+class HybridFeedTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username=cs.AUTHOR_NAME)
+        cls.user = User.objects.create_user(username=cs.USER_NAME)
+        cls.other_author = User.objects.create_user(username=POST_USER)
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_celebrity_posts_are_pulled(self):
+        """Посты популярного автора не раскладываются по лентам,
+        а подмешиваются при чтении в порядке pub_date."""
+        Follow.objects.create(user=self.user, author=self.author)
+        Follow.objects.create(user=self.other_author, author=self.author)
+        cache.clear()
+        posts = [
+            Post.objects.create(author=self.author, text=f'{cs.POST_TEXT} {i}')
+            for i in range(POSTS_PER_PAGE + POSTS_SECOND_PAGE)
+        ]
+        self.assertFalse(FeedEntry.objects.exists())
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        page_obj = response.context['page_obj']
+        self.assertEqual(
+            list(page_obj.object_list), posts[::-1][:POSTS_PER_PAGE]
+        )
+        response = self.authorized_client.get(
+            reverse('posts:follow_index'), {'cursor': page_obj.next_cursor}
+        )
+        self.assertEqual(
+            list(response.context['page_obj'].object_list), posts[:1]
+        )
+
+    def test_author_leaving_celebrities_is_backfilled(self):
+        """Когда автор опускается ниже порога, его посты, пропущенные
+        раскладкой, появляются в лентах подписчиков."""
+        Follow.objects.create(user=self.user, author=self.author)
+        cache.clear()
+        post = Post.objects.create(author=self.author, text=cs.POST_TEXT)
+        Follow.objects.create(user=self.other_author, author=self.author)
+        self.assertFalse(FeedEntry.objects.exists())
+        with override_settings(FEED_PULL_THRESHOLD=2):
+            call_command('feed_celebrities', refresh=True, stdout=StringIO())
+            response = self.authorized_client.get(
+                reverse('posts:follow_index')
+            )
+        self.assertEqual(list(response.context['page_obj']), [post])
+        self.assertEqual(
+            set(FeedEntry.objects.values_list('user', 'post')),
+            {(self.user.pk, post.pk), (self.other_author.pk, post.pk)},
+        )
+
+    def test_requests_read_celebrities_from_stats(self):
+        """Запрос ленты не считает агрегат по подпискам и не дозаполняет
+        ленты: набор знаменитостей берётся из UserStats."""
+        Follow.objects.create(user=self.user, author=self.author)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.authorized_client.get(reverse('posts:follow_index'))
+        sql = ' '.join(query['sql'] for query in queries)
+        self.assertNotIn('HAVING COUNT(', sql)
+        self.assertIn('posts_userstats', sql)
+        self.assertEqual(cache.get(CELEBRITIES_CACHE_KEY), {self.author.pk})
+
+    def test_refresh_skipped_while_locked(self):
+        """Пока пересчёт идёт в другом процессе, второй не начинается."""
+        cache.add(CELEBRITIES_LOCK_KEY, 1)
+        self.assertIsNone(refresh_celebrities())
+        self.assertIsNone(cache.get(CELEBRITIES_CACHE_KEY))
+
+    def test_feed_celebrities_command(self):
+        """Команда показывает авторов с подписчиками сверх порога."""
+        Follow.objects.create(user=self.user, author=self.author)
+        out = StringIO()
+        call_command('feed_celebrities', stdout=out)
+        self.assertIn(cs.AUTHOR_NAME, out.getvalue())
+        self.assertNotIn(POST_USER, out.getvalue())
+
+
+class PageCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username=cs.AUTHOR_NAME)
+        cls.post = Post.objects.create(author=cls.author, text=cs.POST_TEXT)
+
+    def setUp(self):
+        cache.clear()
+        reset_page_cache_stats()
+        self.guest_client = Client()
+
+    def test_stale_page_served_while_rebuild_locked(self):
+        """Пока страницу перестраивает другой процесс,
+        отдаётся устаревшая копия."""
+        response_1 = self.guest_client.get(PAG_PROFILE_URL)
+        self.guest_client.get(PAG_PROFILE_URL)
+        Post.objects.create(author=self.author, text=POST_TEXT_NEW)
+        with mock.patch(
+            'core.cache.pages.acquire_rebuild_lock', return_value=False
+        ):
+            response_2 = self.guest_client.get(PAG_PROFILE_URL)
+        self.assertEqual(response_1.content, response_2.content)
+        response_3 = self.guest_client.get(PAG_PROFILE_URL)
+        self.assertContains(response_3, POST_TEXT_NEW)
+        self.assertEqual(
+            page_cache_stats()['anonymous:posts:profile'],
+            {'hit': 1, 'miss': 1, 'stale': 1, 'rebuild': 1},
+        )
+
+    @override_settings(PAGE_CACHE_MISS_WAIT=0.1)
+    def test_cold_miss_waits_for_rebuild_lock(self):
+        """Страницу, которой нет в кеше, строит процесс, взявший
+        блокировку; остальные сначала ждут её и только потом строят
+        сами."""
+        with mock.patch(
+            'core.cache.pages.acquire_rebuild_lock', return_value=False
+        ) as acquire:
+            with mock.patch(
+                'core.cache.pages.time.sleep'
+            ) as sleep:
+                response = self.guest_client.get(PAG_PROFILE_URL)
+        acquire.assert_called_once()
+        self.assertTrue(sleep.called)
+        self.assertContains(response, cs.POST_TEXT)
+
+    def test_hits_do_not_write_to_cache(self):
+        """Попадание в кеш не пишет счётчики в общий кеш."""
+        self.guest_client.get(PAG_PROFILE_URL)
+        self.guest_client.get(PAG_PROFILE_URL)
+        with mock.patch.object(cache, 'incr') as incr:
+            self.guest_client.get(PAG_PROFILE_URL)
+        incr.assert_not_called()
+        self.assertEqual(
+            page_cache_stats()['anonymous:posts:profile']['hit'], 2
+        )
+
+    def test_pages_cached_per_user(self):
+        """Закешированная страница не отдаётся другому пользователю."""
+        self.guest_client.get(PAG_PROFILE_URL)
+        user_client = Client()
+        user_client.force_login(self.author)
+        response = user_client.get(PAG_PROFILE_URL)
+        self.assertContains(response, cs.AUTHOR_NAME)
+        self.assertIsNotNone(response.context)
+
+    def test_anonymous_pages_served_without_queries(self):
+        """Анонимный запрос без cookie обслуживается кешем без базы."""
+        urls = (
+            PAG_INDEX_URL,
+            PAG_PROFILE_URL,
+            reverse(cs.POST_DETAIL_URL, kwargs={'post_id': self.post.id}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.guest_client.get(url)
+                with self.assertNumQueries(0):
+                    response = self.guest_client.get(url)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_anonymous_cache_skipped_with_cookies(self):
+        """Запросы с cookie и авторизованные не получают
+        анонимную страницу из кеша."""
+        self.guest_client.get(PAG_INDEX_URL)
+        self.guest_client.cookies['csrftoken'] = 'token'
+        response = self.guest_client.get(PAG_INDEX_URL)
+        self.assertIsNotNone(response.context)
+        user_client = Client()
+        user_client.force_login(self.author)
+        response = user_client.get(PAG_INDEX_URL)
+        self.assertContains(response, 'Выйти')
+
+    def test_post_detail_cache_invalidated_by_comment(self):
+        """Новый комментарий сбрасывает кеш страницы поста."""
+        url = reverse(cs.POST_DETAIL_URL, kwargs={'post_id': self.post.id})
+        self.guest_client.get(url)
+        Comment.objects.create(
+            post=self.post, author=self.author, text=cs.POST_COMMENT
+        )
+        self.assertContains(self.guest_client.get(url), cs.POST_COMMENT)
+
+
+class PostCardCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username=cs.AUTHOR_NAME)
+        cls.group = Group.objects.create(
+            title=cs.GROUP_TITLE,
+            slug=cs.GROUP_SLUG,
+            description=cs.GROUP_DESCRIPTION,
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, text=cs.POST_TEXT, group=cls.group
+        )
+        cls.template = Template('{% load post_cards %}{% post_card post %}')
+
+    def setUp(self):
+        cache.clear()
+
+    def render(self):
+        post = Post.objects.select_related('author', 'group').get(
+            pk=self.post.pk
+        )
+        return self.template.render(Context({'post': post}))
+
+    def test_card_rendered_once(self):
+        """Карточка берётся из кеша, пока пост, автор и группа
+        не изменились."""
+        first = self.render()
+        Post.objects.filter(pk=self.post.pk).update(text=POST_TEXT_NEW)
+        self.assertEqual(self.render(), first)
+
+        post = Post.objects.get(pk=self.post.pk)
+        post.save()
+        self.assertIn(POST_TEXT_NEW, self.render())
+
+    def test_card_invalidated_by_group_and_author(self):
+        """Изменение группы или автора сбрасывает карточку."""
+        self.render()
+        group = Group.objects.get(pk=self.group.pk)
+        group.title = POST_TEXT_OLD
+        group.save()
+        self.assertIn(POST_TEXT_OLD, self.render())
+
+        author = User.objects.get(pk=self.author.pk)
+        author.username = POST_USER
+        author.save()
+        self.assertIn(POST_USER, self.render())
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Лесник')
+        cls.group = Group.objects.create(
+            title='Походы',
+            slug=cs.GROUP_SLUG,
+            description=cs.GROUP_DESCRIPTION,
+        )
+        cls.forest = Post.objects.create(
+            author=cls.author, text='Весенний лес шумит'
+        )
+        cls.river = Post.objects.create(
+            author=User.objects.create_user(username=cs.USER_NAME),
+            text='Река и лес',
+            group=cls.group,
+        )
+
+    def search(self, query):
+        response = self.client.get(reverse(cs.SEARCH_URL), {'q': query})
+        return list(response.context['page_obj'])
+
+    def test_search_by_text_author_and_group(self):
+        """Поиск находит посты по словам текста, автору и группе."""
+        self.assertCountEqual(self.search('ЛЕС'), [self.forest, self.river])
+        self.assertEqual(self.search('весен'), [self.forest])
+        self.assertEqual(self.search('лесник'), [self.forest])
+        self.assertEqual(self.search('походы река'), [self.river])
+        self.assertEqual(self.search('"*) OR'), [])
+        self.assertEqual(self.search(''), [])
+
+    def test_author_match_ranked_first(self):
+        """Совпадение в имени автора выше совпадения в тексте."""
+        Post.objects.create(author=self.author, text='Просто пост')
+        post = Post.objects.create(
+            author=User.objects.create_user(username='Другой'),
+            text='Лесник рассказал',
+        )
+        results = self.search('лесник')
+        self.assertEqual(results[-1], post)
+
+    def test_index_follows_changes(self):
+        """Индекс обновляется при правке и удалении постов и групп."""
+        forest = Post.objects.get(pk=self.forest.pk)
+        forest.text = 'Зимнее поле'
+        forest.save()
+        self.assertEqual(self.search('весенний'), [])
+        self.assertEqual(self.search('поле'), [forest])
+        Group.objects.get(pk=self.group.pk).delete()
+        self.assertEqual(self.search('походы'), [])
+        Post.objects.get(pk=self.river.pk).delete()
+        self.assertEqual(self.search('река'), [])
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке идёт по тому же индексу."""
+        queryset, _ = PostAdmin(Post, admin.site).get_search_results(
+            None, Post.objects.all(), 'походы'
+        )
+        self.assertEqual(list(queryset), [self.river])
+
+    def test_pagination_keeps_query(self):
+        """Ссылки на страницы выдачи сохраняют запрос."""
+        Post.objects.bulk_create(
+            Post(author=self.author, text=f'Лес {i}') for i in range(12)
+        )
+        call_command('rebuild_search', stdout=StringIO())
+        response = self.client.get(reverse(cs.SEARCH_URL), {'q': 'лес'})
+        self.assertEqual(response.context['page_obj'].paginator.count, 14)
+        self.assertContains(response, '?q=%D0%BB%D0%B5%D1%81&amp;page=2')
+
+
+class TagTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username=cs.AUTHOR_NAME)
+
+    def setUp(self):
+        cache.clear()
+
+    def tag_page(self, slug):
+        return self.client.get(reverse(cs.TAG_URL, args=[slug]))
+
+    def test_tags_extracted_on_save(self):
+        """Теги из текста попадают в таблицу связей и меняются с текстом."""
+        post = Post.objects.create(
+            author=self.author, text='#Лес и #river_2, не тег: a#b #42'
+        )
+        self.assertCountEqual(
+            post.tags.values_list('slug', flat=True), ['лес', 'river_2']
+        )
+        post.text = 'Только #лес'
+        post.save()
+        self.assertEqual(list(post.tags.values_list('slug', flat=True)),
+                         ['лес'])
+        self.assertEqual(Tag.objects.get(slug='river_2').posts_count, 0)
+        post.delete()
+        self.assertFalse(PostTag.objects.exists())
+        self.assertEqual(Tag.objects.get(slug='лес').posts_count, 0)
+
+    def test_tag_page(self):
+        """Страница тега показывает только его посты, новые первыми."""
+        first = Post.objects.create(author=self.author, text='#лес утром')
+        Post.objects.create(author=self.author, text='Без тегов')
+        second = Post.objects.create(author=self.author, text='#ЛЕС вечером')
+        response = self.tag_page('лес')
+        self.assertTemplateUsed(response, cs.TAG_TEMPLATE)
+        self.assertEqual(list(response.context['page_obj']), [second, first])
+        self.assertContains(
+            response, f'href="{reverse(cs.TAG_URL, args=["лес"])}">#лес</a>'
+        )
+        self.assertEqual(self.tag_page('нет').status_code,
+                         HTTPStatus.NOT_FOUND)
+
+    def test_tag_page_paginated(self):
+        """Страница тега делится на страницы, как лента."""
+        for i in range(POSTS_PER_PAGE + POSTS_SECOND_PAGE):
+            Post.objects.create(author=self.author, text=f'#лес {i}')
+        response = self.tag_page('лес')
+        self.assertEqual(len(response.context['page_obj']), POSTS_PER_PAGE)
+        response = self.client.get(
+            reverse(cs.TAG_URL, args=['лес']),
+            {'cursor': response.context['page_obj'].next_cursor},
+        )
+        self.assertEqual(len(response.context['page_obj']),
+                         POSTS_SECOND_PAGE)
+
+    def test_trending_updated_incrementally(self):
+        """Популярные теги правятся в кеше без пересчёта по таблице."""
+        Post.objects.create(author=self.author, text='#лес #река')
+        Post.objects.create(author=self.author, text='#лес')
+        self.assertEqual(trending_tags(), [('лес', 2), ('река', 1)])
+        with self.assertNumQueries(0):
+            trending_tags()
+        post = Post.objects.create(author=self.author, text='#поле #река')
+        self.assertEqual(
+            trending_tags(), [('лес', 2), ('река', 2), ('поле', 1)]
+        )
+        post.delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(trending_tags(), [('лес', 2), ('река', 1)])
+        response = self.client.get(reverse(cs.INDEX_URL))
+        self.assertContains(response, '#река</a> (1)')
+
+    @override_settings(TRENDING_TAGS_LIMIT=1)
+    def test_trending_rebuilt_when_top_tag_drops(self):
+        """Если тег из полного списка стал реже, список собирается заново."""
+        post = Post.objects.create(author=self.author, text='#лес')
+        Post.objects.create(author=self.author, text='#лес #река')
+        Post.objects.create(author=self.author, text='#река')
+        self.assertEqual(trending_tags(), [('лес', 2)])
+        post.delete()
+        self.assertEqual(trending_tags(), [('река', 2)])
+
+
+@override_settings(COMMENTS_PER_PAGE=3)
+class CommentsPaginationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.post = Post.objects.create(
+            author=User.objects.create_user(username=cs.AUTHOR_NAME),
+            text=cs.POST_TEXT,
+        )
+        cls.comments = [
+            Comment.objects.create(
+                post=cls.post,
+                author=User.objects.create_user(username=f'reader_{i}'),
+                text=f'{cs.POST_COMMENT} {i}',
+            )
+            for i in range(7)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_post_detail_shows_first_page(self):
+        """На странице поста только первая порция новых комментариев,
+        авторы приходят тем же запросом."""
+        url = reverse(cs.POST_DETAIL_URL, args=[self.post.id])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        comments = response.context['comments']
+        self.assertEqual(list(comments), self.comments[:-4:-1])
+        self.assertContains(response, 'data-more-comments')
+        author_queries = [
+            query for query in queries
+            if 'auth_user' in query['sql'] and 'posts_comment' not in
+            query['sql']
+        ]
+        self.assertEqual(len(author_queries), 1)
+
+    def test_more_comments_fragment(self):
+        """Фрагмент отдаёт следующие порции по курсору до конца."""
+        url = reverse(cs.POST_DETAIL_URL, args=[self.post.id])
+        cursor = self.client.get(url).context['comments'].next_cursor
+        seen = []
+        while cursor:
+            response = self.client.get(
+                reverse('posts:post_comments', args=[self.post.id]),
+                {'cursor': cursor},
+            )
+            self.assertTemplateUsed(
+                response, 'posts/includes/comment_list.html'
+            )
+            self.assertNotContains(response, '<html')
+            seen += response.context['comments']
+            cursor = response.context['comments'].next_cursor
+        self.assertEqual(seen, self.comments[-4::-1])
+
+    def test_more_comments_unknown_post(self):
+        """Фрагмент несуществующего поста отдаёт 404."""
+        response = self.client.get(
+            reverse('posts:post_comments', args=[self.post.id + 1])
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+class QueryPlansTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        author = User.objects.create_user(username=cs.AUTHOR_NAME)
+        reader = User.objects.create_user(username=cs.USER_NAME)
+        group = Group.objects.create(
+            title=cs.GROUP_TITLE,
+            slug=cs.GROUP_SLUG,
+            description=cs.GROUP_DESCRIPTION,
+        )
+        Follow.objects.create(user=reader, author=author)
+        post = Post.objects.create(
+            author=author, text='#лес и поле', group=group
+        )
+        Comment.objects.create(post=post, author=reader, text=cs.POST_COMMENT)
+
+    def test_listing_queries_use_indexes(self):
+        """Ни одна страница постов не читает таблицу целиком и не
+        сортирует во временном B-дереве."""
+        out = StringIO()
+        call_command('check_query_plans', stdout=out)
+        self.assertIn('проблем нет', out.getvalue())
+
+    def test_cursor_pages_checked(self):
+        """У каждого списка постов проверяется и страница по курсору."""
+        cursor_views = {
+            view_name for view_name, url, _ in CheckQueryPlans().requests()
+            if '?cursor=' in url and url.split('?cursor=')[1]
+        }
+        self.assertEqual(cursor_views, {
+            'posts:index', 'posts:profile', 'posts:post_comments',
+            'posts:follow_index', 'posts:group_list', 'posts:tag_posts',
+        })
+
+    def test_temp_sort_reported(self):
+        """Без разрешения сортировка выдачи поиска считается ошибкой."""
+        out = StringIO()
+        with mock.patch.object(CheckQueryPlans, 'allowed',
+                               return_value=False):
+            with self.assertRaises(CommandError):
+                call_command('check_query_plans', stdout=out)
+        self.assertIn('USE TEMP B-TREE', out.getvalue())
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class LoadTestCommandTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        author = User.objects.create_user(username=cs.AUTHOR_NAME)
+        reader = User.objects.create_user(username=cs.USER_NAME)
+        Follow.objects.create(user=reader, author=author)
+        Post.objects.create(author=author, text='лес и поле')
+        call_command('recount', stdout=StringIO())
+
+    def load(self, mix):
+        out = StringIO()
+        call_command(
+            'load_test', threads=1, requests=30, duration=60, mix=mix,
+            stdout=out,
+        )
+        return out.getvalue()
+
+    def test_mixed_traffic(self):
+        """Смесь чтений и записей проходит через WSGI-приложение,
+        сессии после теста удаляются."""
+        out = self.load('index=1,feed=1,post=1,comment=1,follow=1')
+        self.assertIn('Запросов: 30 ', out)
+        self.assertIn('Задержка index:', out)
+        self.assertIn('anonymous:posts:index', out)
+        self.assertGreater(Post.objects.count(), 1)
+        self.assertTrue(Comment.objects.exists())
+        self.assertFalse(Session.objects.exists())
+
+    def test_lock_errors_counted(self):
+        """Ошибка «database is locked» считается отдельно от прочих."""
+        with mock.patch(
+            'posts.views.feed_page',
+            side_effect=OperationalError('database is locked'),
+        ):
+            out = self.load('feed=1')
+        self.assertRegex(out, r'\nfeed\t30\t.*\t30\t30\n')
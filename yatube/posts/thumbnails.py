@@ -0,0 +1,350 @@
+"""Обработка картинок постов и превью, подготовленные заранее.
+
+После сохранения поста с картинкой воркер из пула процессов убирает
+из оригинала EXIF, уменьшает слишком большой оригинал и строит каждый
+размер из POST_THUMBNAIL_SIZES в нескольких ширинах и форматах:
+Pillow занимает процессор, и ни один веб-запрос не ждёт пережатия.
+Готовый набор (srcset для каждого формата) записывается в кеш,
+шаблоны берут его оттуда и до готовности показывают заглушку. Когда
+превью готово, версия поста меняется, и закешированные карточки
+и страницы перестраиваются уже с картинкой.
+"""
+import base64
+import hashlib
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+import django
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from core.cache.pages import bump_version
+
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_KEY = 'thumbnail:{size}:{name}'
+EXIF_ORIENTATION = 0x0112
+ROTATED_ORIENTATIONS = (5, 6, 7, 8)
+MIME_TYPES = {'AVIF': 'image/avif', 'WEBP': 'image/webp', 'JPEG': 'image/jpeg'}
+BUILD_LOCK_KEY = 'lock:thumbnail:{name}'
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _cache():
+    return caches[settings.PAGE_CACHE_ALIAS]
+
+
+def _name_hash(name):
+    return hashlib.md5(name.encode()).hexdigest()
+
+
+def thumbnail_key(name, size):
+    return THUMBNAIL_KEY.format(size=size, name=_name_hash(name))
+
+
+def ready_thumbnail(name, size):
+    """Готовый набор превью размера size или None.
+
+    Набор — словарь с url, width и height самого широкого варианта
+    в запасном формате, srcset для него и sources: по одному srcset
+    на каждый более современный формат.
+    """
+    return _cache().get(thumbnail_key(name, size))
+
+
+def display_size(post, size):
+    """Ширина и высота, которые займёт превью размера size.
+
+    Превью с crop всегда имеет пропорции geometry. Без crop картинка
+    вписывается в geometry, и рамку заранее дают её размеры из поста:
+    заглушка занимает ровно столько места, сколько потом превью.
+    """
+    width, height = map(int, size['geometry'].split('x'))
+    options = size['options']
+    if options.get('crop') or not (post.image_width and post.image_height):
+        return width, height
+    scale = min(width / post.image_width, height / post.image_height)
+    if not options.get('upscale'):
+        scale = min(scale, 1)
+    return (
+        max(round(post.image_width * scale), 1),
+        max(round(post.image_height * scale), 1),
+    )
+
+
+def _oriented_size(image):
+    width, height = image.size
+    if image.getexif().get(EXIF_ORIENTATION) in ROTATED_ORIENTATIONS:
+        return height, width
+    return width, height
+
+
+def _placeholder(image):
+    size = settings.POST_IMAGE_PLACEHOLDER_SIZE
+    preview = image.copy()
+    preview.thumbnail((size, size))
+    preview = ImageOps.exif_transpose(preview).convert('RGB')
+    buffer = BytesIO()
+    preview.save(buffer, 'JPEG', quality=40)
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/jpeg;base64,{encoded}'
+
+
+def image_size(file):
+    """Размеры картинки по заголовку, с учётом поворота из EXIF.
+
+    Картинка при этом не декодируется, поэтому вызов дёшев
+    и годится для веб-запроса. Заглушку строит воркер.
+    """
+    if not file:
+        return {
+            'image_width': None,
+            'image_height': None,
+            'image_placeholder': '',
+        }
+    file.seek(0)
+    with Image.open(file) as image:
+        width, height = _oriented_size(image)
+    file.seek(0)
+    return {
+        'image_width': width,
+        'image_height': height,
+        'image_placeholder': '',
+    }
+
+
+def image_metadata(file):
+    """Размеры картинки и её крошечная копия (LQIP) для полей Post.
+
+    Копия шириной POST_IMAGE_PLACEHOLDER_SIZE пикселей хранится как
+    data URI и показывается размытой, пока не загрузится картинка.
+    """
+    metadata = image_size(file)
+    if file:
+        with Image.open(file) as image:
+            metadata['image_placeholder'] = _placeholder(image)
+        file.seek(0)
+    return metadata
+
+
+def normalize_image(post_id, name):
+    """Убирает EXIF и уменьшает слишком большой оригинал картинки поста.
+
+    Новый файл сохраняется рядом, путь в посте меняется, только если
+    пост всё ещё указывает на name; старый файл удаляется, если на него
+    больше не ссылается ни один пост. Заодно
+    заполняется заглушка. Возвращает актуальный путь картинки или
+    None, если пост удалён или картинку уже заменили.
+    """
+    limit = settings.POST_IMAGE_MAX_DIMENSION
+    post = Post.objects.filter(pk=post_id, image=name).values(
+        'image_placeholder'
+    ).first()
+    if post is None:
+        return None
+    storage = Post.image.field.storage
+    with storage.open(name) as file, Image.open(file) as image:
+        image_format = image.format
+        needs_work = (
+            max(image.size) > limit or 'exif' in image.info
+        ) and not getattr(image, 'is_animated', False)
+        if not needs_work:
+            if not post['image_placeholder']:
+                Post.objects.filter(pk=post_id, image=name).update(
+                    image_placeholder=_placeholder(image)
+                )
+            return name
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((limit, limit))
+        image.info.pop('exif', None)
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L', 'CMYK'):
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    options = {'quality': 90} if image_format == 'JPEG' else {}
+    image.save(buffer, image_format, **options)
+    new_name = storage.save(name, ContentFile(buffer.getvalue()))
+    updated = Post.objects.filter(pk=post_id, image=name).update(
+        image=new_name,
+        image_width=image.width,
+        image_height=image.height,
+        image_placeholder=_placeholder(image),
+    )
+    if not updated:
+        delete_unused_image(new_name)
+        return None
+    delete_unused_image(name)
+    return new_name
+
+
+def delete_unused_image(name):
+    """Удаляет файл картинки, если на него не ссылается ни один пост.
+
+    Хранилище картинок складывает одинаковые файлы в один, поэтому
+    удалять файл вместе с постом нельзя.
+    """
+    if name and not Post.objects.filter(image=name).exists():
+        Post.image.field.storage.delete(name)
+
+
+def process_image(post_id, name):
+    """Задача воркера: нормализует картинку поста и строит её превью."""
+    current = normalize_image(post_id, name)
+    if current != name:
+        _cache().delete(BUILD_LOCK_KEY.format(name=_name_hash(name)))
+    if current is not None:
+        build_thumbnails(post_id, current)
+
+
+def supported_formats():
+    """Форматы из POST_THUMBNAIL_FORMATS, которые умеют Pillow и sorl."""
+    from sorl.thumbnail.base import EXTENSIONS
+
+    Image.init()
+    return [
+        image_format for image_format in settings.POST_THUMBNAIL_FORMATS
+        if image_format in Image.SAVE and image_format in EXTENSIONS
+    ]
+
+
+def _srcset(thumbnails):
+    return ', '.join(
+        f'{thumbnail.url} {thumbnail.width}w' for thumbnail in thumbnails
+    )
+
+
+def _build_size(name, size):
+    from sorl.thumbnail import get_thumbnail
+
+    width, height = map(int, size['geometry'].split('x'))
+    sources = []
+    for image_format in supported_formats():
+        thumbnails = []
+        for variant in sorted(size['widths']):
+            geometry = f'{variant}x{round(variant * height / width)}'
+            thumbnail = get_thumbnail(
+                name, geometry, format=image_format, **size['options']
+            )
+            if thumbnail.size is None:
+                return None
+            thumbnails.append(thumbnail)
+        sources.append((image_format, thumbnails))
+    if not sources:
+        return None
+    fallback_format, fallback = sources.pop()
+    return {
+        'url': fallback[-1].url,
+        'width': fallback[-1].width,
+        'height': fallback[-1].height,
+        'srcset': _srcset(fallback),
+        'sizes': size['sizes'],
+        'sources': [
+            {'type': MIME_TYPES[image_format], 'srcset': _srcset(thumbnails)}
+            for image_format, thumbnails in sources
+        ],
+    }
+
+
+def build_thumbnails(post_id, name, bump_posts=True):
+    """Строит все размеры, ширины и форматы превью картинки name.
+
+    bump_posts=False оставляет общую версию постов: её сбросит один
+    раз тот, кто строит превью пачкой.
+    """
+    from .signals import POSTS_VERSION
+
+    cache = _cache()
+    for size_name, size in settings.POST_THUMBNAIL_SIZES.items():
+        thumbnail = _build_size(name, size)
+        if thumbnail is None:
+            # Исходник не читается: превью не будет, остаётся заглушка.
+            logger.warning('Не удалось прочитать картинку %s', name)
+            continue
+        cache.set(thumbnail_key(name, size_name), thumbnail, None)
+    cache.delete(BUILD_LOCK_KEY.format(name=_name_hash(name)))
+    bump_version(f'post:{post_id}')
+    if bump_posts:
+        bump_version(POSTS_VERSION)
+
+
+def create_pool(workers):
+    # spawn, а не fork: сервер многопоточный, а дочернему
+    # процессу не нужны чужие соединения с базой и кешем.
+    # Инициализатор — сам django.setup: функция из этого модуля
+    # потянула бы импорт моделей раньше настройки Django.
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=django.setup,
+    )
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = create_pool(settings.POST_THUMBNAIL_WORKERS)
+        return _pool
+
+
+def _reset_pool(broken):
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+
+
+def _log_failure(future):
+    error = future.exception()
+    if error is not None:
+        logger.error('Не удалось обработать картинку', exc_info=error)
+
+
+def _submit(post_id, name):
+    if not settings.POST_THUMBNAIL_WORKERS:
+        try:
+            process_image(post_id, name)
+        except Exception:
+            logger.exception('Не удалось обработать картинку')
+        return
+    pool = _get_pool()
+    try:
+        future = pool.submit(process_image, post_id, name)
+    except BrokenProcessPool:
+        _reset_pool(pool)
+        future = _get_pool().submit(process_image, post_id, name)
+    future.add_done_callback(_log_failure)
+
+
+def schedule_thumbnails(post):
+    """Ставит построение превью поста в очередь после коммита.
+
+    Одна и та же картинка не попадает в очередь повторно, пока её
+    не обработали или не истекла блокировка.
+    """
+    if not post.image:
+        return
+    name = post.image.name
+    cache = _cache()
+    keys = [
+        thumbnail_key(name, size) for size in settings.POST_THUMBNAIL_SIZES
+    ]
+    if len(cache.get_many(keys)) == len(keys):
+        return
+    if not cache.add(
+        BUILD_LOCK_KEY.format(name=_name_hash(name)), 1,
+        settings.POST_THUMBNAIL_LOCK_TIMEOUT,
+    ):
+        return
+    post_id = post.pk
+    transaction.on_commit(lambda: _submit(post_id, name))
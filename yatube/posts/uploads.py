@@ -0,0 +1,83 @@
+"""Ограничения на загружаемые картинки, проверяемые на лету.
+
+ImageLimitUploadHandler стоит первым в FILE_UPLOAD_HANDLERS и видит
+каждый кусок файла раньше, чем тот попадёт в память или на диск.
+Файл больше POST_IMAGE_MAX_UPLOAD_SIZE байт или картинка, в заголовке
+которой больше POST_IMAGE_MAX_PIXELS пикселей, дальше не пишется:
+остаток тела запроса просто вычитывается, а PostForm получает
+RejectedUpload и показывает его ошибку. Размеры берутся из заголовка
+без декодирования картинки.
+"""
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.template.defaultfilters import filesizeformat
+from PIL import Image
+
+HEADER_LIMIT = 256 * 1024
+
+
+class RejectedUpload(UploadedFile):
+    """Файл, отброшенный при загрузке; содержимого у него нет."""
+
+    def __init__(self, name, content_type, size, error):
+        super().__init__(BytesIO(), name, content_type, size)
+        self.upload_error = error
+
+
+class ImageLimitUploadHandler(FileUploadHandler):
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.header = b''
+        self.error = None
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.error is not None:
+            return None
+        self.received += len(raw_data)
+        limit = settings.POST_IMAGE_MAX_UPLOAD_SIZE
+        if self.received > limit:
+            self.error = (
+                f'Файл больше {filesizeformat(limit)}, '
+                f'загрузите картинку поменьше'
+            )
+            return None
+        if self.header is not None:
+            self._check_header(raw_data)
+            if self.error is not None:
+                return None
+        return raw_data
+
+    def file_complete(self, file_size):
+        if self.error is None:
+            return None
+        return RejectedUpload(
+            self.file_name, self.content_type, self.received, self.error
+        )
+
+    def _check_header(self, raw_data):
+        self.header += raw_data
+        limit = settings.POST_IMAGE_MAX_PIXELS
+        try:
+            # Image.open читает только заголовок и память под
+            # пиксели не выделяет.
+            with Image.open(BytesIO(self.header)) as image:
+                pixels = image.width * image.height
+        except Image.DecompressionBombError:
+            pixels = limit + 1
+        except OSError:
+            # Заголовок ещё не пришёл целиком или это не картинка:
+            # второе проверит форма.
+            if len(self.header) > HEADER_LIMIT:
+                self.header = None
+            return
+        self.header = None
+        if pixels > limit:
+            self.error = (
+                f'Картинка больше {limit / 1_000_000:g} Мпикс, '
+                f'загрузите картинку поменьше'
+            )
@@ -1,8 +1,158 @@
-from django.core.paginator import Paginator
+import base64
+import binascii
 
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
 
-def pagination(request, posts_data, posts_per_page=10):
-    paginator = Paginator(posts_data, posts_per_page)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+CURSOR_PARAM = 'cursor'
+CURSOR_NEXT = 'n'
+CURSOR_PREVIOUS = 'p'
+
+
+def encode_cursor(obj, direction=CURSOR_NEXT, key='pub_date'):
+    """Кодирует позицию объекта (key, id) в непрозрачную строку."""
+    raw = f'{direction}|{getattr(obj, key).isoformat()}|{obj.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Возвращает (direction, pub_date, id) или None для битого курсора."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        direction, pub_date, pk = raw.split('|')
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        return None
+    if direction not in (CURSOR_NEXT, CURSOR_PREVIOUS) or pub_date is None:
+        return None
+    return direction, pub_date, pk
+
+
+class CursorPaginator(Paginator):
+    """Постраничный вывод по ключу (key, id) без OFFSET и COUNT(*).
+
+    Стоимость любой страницы одинакова: это один запрос с LIMIT
+    по индексу key, начиная с позиции, закодированной в курсоре.
+    tiebreak — столбец с тем же значением, что и id поста, по которому
+    сортировать при равных key: для постов, читаемых через таблицу
+    связей, это её ссылка на пост, иначе индекс связей не отсортирует.
+    """
+
+    def __init__(self, object_list, per_page, key='pub_date', tiebreak='pk'):
+        self.key = key
+        super().__init__(
+            object_list.order_by(f'-{key}', f'-{tiebreak}'), per_page
+        )
+
+    def get_cursor_page(self, cursor):
+        position = decode_cursor(cursor) if cursor else None
+        direction = position[0] if position else None
+        return self.build_page(self.window(position), direction)
+
+    def window(self, position):
+        """До per_page + 1 объектов от позиции курсора в порядке обхода."""
+        if position is None:
+            return list(self.object_list[:self.per_page + 1])
+        direction, value, pk = position
+        key = self.key
+        if direction == CURSOR_NEXT:
+            objects = self.object_list.filter(
+                Q(**{f'{key}__lt': value}) | Q(**{key: value, 'pk__lt': pk})
+            )
+        else:
+            objects = self.object_list.filter(
+                Q(**{f'{key}__gt': value}) | Q(**{key: value, 'pk__gt': pk})
+            ).reverse()
+        return list(objects[:self.per_page + 1])
+
+    def build_page(self, objects, direction):
+        has_more = len(objects) > self.per_page
+        objects = objects[:self.per_page]
+        if direction == CURSOR_PREVIOUS:
+            objects.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, direction is not None
+        return CursorPage(objects, self, has_next, has_previous)
+
+
+class CursorPage(Page):
+    """Страница, совместимая с includes/paginator.html.
+
+    Вместо номеров страниц отдаёт курсоры соседних страниц.
+    """
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        super().__init__(object_list, None, paginator)
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return '<Cursor page>'
+
+    def has_next(self):
+        return self._has_next and bool(self.object_list)
+
+    def has_previous(self):
+        return self._has_previous and bool(self.object_list)
+
+    @property
+    def next_cursor(self):
+        if self.has_next():
+            return encode_cursor(
+                self.object_list[-1], CURSOR_NEXT, self.paginator.key
+            )
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self.has_previous():
+            return encode_cursor(
+                self.object_list[0], CURSOR_PREVIOUS, self.paginator.key
+            )
+        return None
+
+    def start_index(self):
+        return 1 if self.object_list else 0
+
+    def end_index(self):
+        return len(self.object_list)
+
+
+def pagination(request, posts_data, posts_per_page=10, key='pub_date',
+               tiebreak='pk', count=None):
+    """Первая страница — обычная Page, дальше по курсору.
+
+    Первая страница — это per_page + 1 постов от начала индекса, без
+    OFFSET и COUNT(*); старые адреса ?page=N отдают её же. count —
+    уже известное число постов, например из счётчика. Без него или
+    если счётчик разошёлся с прочитанным, paginator.count знает
+    только, есть ли следующая страница.
+    """
+    paginator = CursorPaginator(posts_data, posts_per_page, key, tiebreak)
+    if CURSOR_PARAM in request.GET:
+        return paginator.get_cursor_page(request.GET.get(CURSOR_PARAM))
+    objects = paginator.window(None)
+    has_next = len(objects) > posts_per_page
+    if count is None or (count > posts_per_page) != has_next:
+        count = len(objects)
+    paginator.count = count
+    page_obj = Page(objects[:posts_per_page], 1, paginator)
+    # Навигация только курсорами: без номеров страниц и «Последней».
+    page_obj.is_keyset = True
+    if page_obj.has_next():
+        page_obj.next_cursor = encode_cursor(
+            objects[posts_per_page - 1], key=key
+        )
     return page_obj
+
+
+def ranked_pagination(request, posts_data, posts_per_page=10):
+    """Постраничный вывод в порядке самого запроса, например по
+    релевантности поиска: такой порядок курсором не продолжить."""
+    paginator = Paginator(posts_data, posts_per_page)
+    return paginator.get_page(request.GET.get('page'))
@@ -1,13 +1,25 @@
+from urllib.parse import urlencode
+
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
 
+from core.cache.pages import versioned_cache_page
+from core.query_budget import query_budget
+
+from .feed import feed_page
 from .forms import CommentForm, PostForm
-from .models import Group, Post, User, Follow
-from .utils import pagination
+from .models import Comment, Group, Post, Tag, User, Follow
+from .search import search_posts
+from .signals import COMMENTS_VERSION, FOLLOWS_VERSION, POSTS_VERSION
+from .stats import stats_for
+from .tags import TAG_TIEBREAK, tagged_posts
+from .utils import (CURSOR_PARAM, CursorPaginator, pagination,
+                    ranked_pagination)
 
 
-@cache_page(20)
+@query_budget(5)
+@versioned_cache_page(POSTS_VERSION)
 def index(request):
     context = {
         'page_obj': pagination(
@@ -18,22 +30,50 @@ def index(request):
     return render(request, 'posts/index.html', context)
 
 
+@query_budget(5)
+@versioned_cache_page(POSTS_VERSION)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
     context = {
-        'page_obj': pagination(request, group.posts.all()),
+        'page_obj': pagination(
+            request, group.posts.select_related('author', 'group')
+        ),
         'group': group,
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@query_budget(5)
+@versioned_cache_page(POSTS_VERSION)
+def tag_posts(request, slug):
+    tag = get_object_or_404(Tag, slug=slug.lower())
+    context = {
+        'page_obj': pagination(
+            request, tagged_posts(tag), key='tag_date',
+            tiebreak=TAG_TIEBREAK, count=tag.posts_count,
+        ),
+        'tag': tag,
+    }
+    return render(request, 'posts/tag_list.html', context)
+
+
+@query_budget(6)
+@versioned_cache_page(POSTS_VERSION, FOLLOWS_VERSION)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    posts_profile_list = Post.objects.filter(author=author)
-    page_obj = pagination(request, posts_profile_list)
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username
+    )
+    author_stats = stats_for(author)
+    posts_profile_list = Post.objects.select_related(
+        'author', 'group'
+    ).filter(author=author)
+    page_obj = pagination(
+        request, posts_profile_list, count=author_stats.posts_count
+    )
     context = {
         'page_obj': page_obj,
         'author': author,
+        'author_stats': author_stats,
         'following': (request.user.is_authenticated
                       and request.user != username
                       and Follow.objects.filter(
@@ -43,17 +83,44 @@ def profile(request, username):
     return render(request, 'posts/profile.html', context)
 
 
+def comments_page(request, post_id):
+    """Страница комментариев поста, новые первыми, с авторами."""
+    paginator = CursorPaginator(
+        Comment.objects.filter(post_id=post_id).select_related('author'),
+        settings.COMMENTS_PER_PAGE,
+        key='created',
+    )
+    return paginator.get_cursor_page(request.GET.get(CURSOR_PARAM))
+
+
+@query_budget(4)
 def post_detail(request, post_id):
     template = 'posts/post_detail.html'
-    post = Post.objects.get(id=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), id=post_id
+    )
     form = CommentForm()
     context = {
         'post': post,
+        'author_stats': stats_for(post.author),
         'form': form,
+        'comments': comments_page(request, post.id),
     }
     return render(request, template, context)
 
 
+@query_budget(4)
+@versioned_cache_page(POSTS_VERSION, COMMENTS_VERSION)
+def post_comments(request, post_id):
+    """Следующая порция комментариев фрагментом HTML для post_detail."""
+    get_object_or_404(Post.objects.only('id'), id=post_id)
+    context = {
+        'post_id': post_id,
+        'comments': comments_page(request, post_id),
+    }
+    return render(request, 'posts/includes/comment_list.html', context)
+
+
 @login_required
 def post_create(request):
     template = 'posts/create_post.html'
@@ -80,18 +147,18 @@ def post_edit(request, post_id):
     )
     if request.user != post.author:
         return redirect('posts:post_detail', post_id)
-    if request.user == post.author:
-        if request.method == 'POST':
-            form.save()
-            return redirect('posts:post_detail', post_id)
-        context = {
-            'form': form,
-            'is_edit': True,
-            'post': post,
-        }
+    if request.method == 'POST' and form.is_valid():
+        form.save()
+        return redirect('posts:post_detail', post_id)
+    context = {
+        'form': form,
+        'is_edit': True,
+        'post': post,
+    }
     return render(request, template, context)
 
 
+@query_budget(5)
 @login_required
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
@@ -104,18 +171,27 @@ def add_comment(request, post_id):
     return redirect('posts:post_detail', post_id=post_id)
 
 
+@query_budget(7)
 @login_required
 def follow_index(request):
-    subscriptions = Follow.objects.filter(user=request.user)
-    authors = [subscription.author for subscription in subscriptions]
-    posts = Post.objects.filter(author__in=authors)
-    page_obj = pagination(request, posts)
+    page_obj = feed_page(request, request.user)
     context = {
         'page_obj': page_obj,
     }
     return render(request, 'posts/follow.html', context)
 
 
+@query_budget(4)
+def search(request):
+    query = request.GET.get('q', '').strip()
+    context = {
+        'query': query,
+        'page_obj': ranked_pagination(request, search_posts(query)),
+        'page_query': urlencode({'q': query}) + '&',
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
 def profile_follow(request, username):
     # Подписаться на автора
@@ -10,11 +10,30 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
+import atexit
 import os
+import shutil
+import sys
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
+TESTING = sys.argv[1:2] == ['test'] or 'pytest' in sys.modules
+
+# Файлы общего кеша и индекса превью. Тесты получают свой временный
+# каталог, чтобы не чистить кеш сайта и не оставлять в индексе превью
+# временных картинок; дочерние процессы узнают его из окружения.
+CACHE_DIR = os.path.join(BASE_DIR, 'cache')
+if TESTING and 'YATUBE_TEST_CACHE_DIR' not in os.environ:
+    os.environ['YATUBE_TEST_CACHE_DIR'] = tempfile.mkdtemp(
+        prefix='yatube-cache-'
+    )
+    atexit.register(
+        shutil.rmtree, os.environ['YATUBE_TEST_CACHE_DIR'], True
+    )
+CACHE_DIR = os.environ.get('YATUBE_TEST_CACHE_DIR', CACHE_DIR)
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/2.2/howto/deployment/checklist/
@@ -54,6 +73,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.QueryBudgetMiddleware',
+    'core.middleware.AnonymousPageCacheMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -152,12 +173,124 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Загрузка картинки обрывается, как только файл превысил размер
+# или в заголовке оказалось слишком много пикселей. Оригиналы
+# больше POST_IMAGE_MAX_DIMENSION по длинной стороне воркер уменьшает.
+FILE_UPLOAD_HANDLERS = [
+    'posts.uploads.ImageLimitUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+POST_IMAGE_MAX_UPLOAD_SIZE = 20 * 1024 * 1024
+POST_IMAGE_MAX_PIXELS = 50_000_000
+POST_IMAGE_MAX_DIMENSION = 2560
+
+# Превью картинок постов строятся заранее в POST_THUMBNAIL_WORKERS
+# процессах; 0 — в текущем процессе сразу после коммита. Каждый размер
+# строится во всех ширинах widths (высота — по пропорции geometry)
+# и во всех форматах из POST_THUMBNAIL_FORMATS, которые поддерживает
+# установленный Pillow; последний формат — запасной для <img>.
+# Размер без crop вписывает картинку в geometry с её пропорциями.
+POST_THUMBNAIL_SIZES = {
+    'card': {
+        'geometry': '960x339',
+        'widths': (320, 640, 960),
+        'options': {'crop': 'center', 'upscale': True},
+        'sizes': '(min-width: 1200px) 960px, 100vw',
+    },
+    'detail': {
+        'geometry': '960x960',
+        'widths': (320, 640, 960),
+        'options': {'upscale': False},
+        'sizes': '(min-width: 1200px) 840px, 100vw',
+    },
+}
+POST_THUMBNAIL_FORMATS = ('WEBP', 'JPEG')
+POST_THUMBNAIL_WORKERS = 2
+# Ключи sorl-thumbnail живут в кеше и в отдельном файле-индексе,
+# а не в основной базе. Прогрев: python manage.py warm_thumbnails
+THUMBNAIL_KVSTORE = 'core.cache.thumbnail_kvstore.KVStore'
+THUMBNAIL_CACHE = 'default'
+THUMBNAIL_INDEX_FILE = os.path.join(CACHE_DIR, 'thumbnails.sqlite3')
+POST_THUMBNAIL_LOCK_TIMEOUT = 60
+# Ширина крошечной копии картинки, которая хранится в посте
+# и видна вместо картинки, пока та загружается.
+POST_IMAGE_PLACEHOLDER_SIZE = 16
+
+# Общий для всех процессов сервера кеш в файле SQLite (shared) и перед
+# ним небольшой кеш в памяти каждого процесса (default). Сравнение
+# общего кеша с LocMemCache: python manage.py cache_benchmark
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'core.cache.backends.tiered.TieredCache',
+        'LOCATION': 'shared',
+        'OPTIONS': {
+            'L1_MAX_ENTRIES': 1000,
+            'L1_TIMEOUT': 5,
+            'SYNC_INTERVAL': 1,
+            'L1_EXCLUDE_PREFIXES': ('lock:', 'page-stats:'),
+        },
+    },
+    'shared': {
+        'BACKEND': 'core.cache.backends.sqlite.SQLiteCache',
+        'LOCATION': os.path.join(CACHE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+            'MAX_SIZE': 64 * 1024 * 1024,
+        },
+    },
+}
+
+# Страницы кешируются до смены версии содержимого, таймаут — страховка.
+PAGE_CACHE_ALIAS = 'default'
+PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+FRAGMENT_CACHE_TIMEOUT = PAGE_CACHE_TIMEOUT
+# Сколько ещё отдаётся устаревшая копия, пока её перестраивает один
+# процесс, и на сколько этот процесс берёт блокировку.
+PAGE_CACHE_STALE_TTL = 60 * 5
+PAGE_CACHE_LOCK_TIMEOUT = 10
+# Сколько ждёт страницу, которой ещё нет в кеше, запрос, не взявший
+# блокировку, прежде чем строить её сам.
+PAGE_CACHE_MISS_WAIT = 2
+# Как часто процесс сбрасывает счётчики кеша страниц в общий кеш.
+PAGE_CACHE_STATS_INTERVAL = 10
+# Страницы, которые анонимам без cookie отдаются целиком из кеша,
+# и версии содержимого, от которых они зависят.
+ANONYMOUS_PAGE_CACHE = {
+    'posts:index': ('posts',),
+    'posts:group_list': ('posts',),
+    'posts:profile': ('posts', 'follows'),
+    'posts:post_detail': ('posts', 'comments'),
+    'posts:tag_posts': ('posts',),
+    'posts:post_comments': ('posts', 'comments'),
 }
 
 INTERNAL_IPS = [
     '127.0.0.1',
 ]
+
+# Лента подписок: сколько старых постов автора попадает в ленту
+# при подписке и каким размером пачки пишутся записи ленты.
+FEED_BACKFILL_LIMIT = 1000
+FEED_BATCH_SIZE = 500
+# Посты авторов, у которых подписчиков больше порога, не раскладываются
+# по лентам, а подмешиваются при чтении. None — только раскладка.
+FEED_PULL_THRESHOLD = 10000
+# Набор таких авторов пересчитывает feed_celebrities --refresh;
+# до этого запросы берут его из UserStats и кешируют на этот срок.
+FEED_CELEBRITIES_TIMEOUT = 300
+FEED_CELEBRITIES_LOCK_TIMEOUT = 60 * 60
+
+# Сколько популярных тегов показывать; кешированный список правится
+# при каждом посте, таймаут — страховка от расхождения со счётчиками.
+TRENDING_TAGS_LIMIT = 10
+TRENDING_TAGS_TIMEOUT = 60 * 60
+
+# Бюджет SQL-запросов view (core.query_budget): в тестах превышение
+# роняет тест, на сервере пишется в лог с отпечатками запросов.
+QUERY_BUDGET_STRICT = TESTING
+QUERY_BUDGET_SERVER_TIMING = DEBUG
+
+# Сколько комментариев показывается на странице поста и подгружается
+# за раз по кнопке «Показать ещё».
+COMMENTS_PER_PAGE = 20